@@ -3,6 +3,7 @@ import logging
 import time
 
 from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
 
 logging.basicConfig(
     level=logging.INFO,
@@ -11,29 +12,37 @@ logging.basicConfig(
 )
 
 print("[startup] Loading modules... (this may take 10-30s on first run)")
-from graph.graph import graph
+from graph.graph import create_workflow_graph
+from graph.summarizer import get_conversation_summarizer
+from modules.storage import get_blob_store
+
+graph = create_workflow_graph().compile(checkpointer=MemorySaver())
+CONFIG = {"configurable": {"thread_id": "demo"}}
 print("[startup] All modules loaded. Ready.\n")
 
 
-async def run(messages: list) -> list:
-    print(f"\n[pipeline] Starting graph with {len(messages)} message(s)...")
+async def run(message: HumanMessage) -> None:
+    print("\n[pipeline] Starting graph...")
     t0 = time.time()
-    result = await graph.ainvoke({"messages": messages})
+    summarizer = get_conversation_summarizer()
+    async with summarizer.thread_lock("demo"):
+        result = await graph.ainvoke({"messages": [message]}, CONFIG)
     elapsed = time.time() - t0
 
     last = result["messages"][-1]
     print(f"\n[Agent]: {last.content}")
     print(f"[pipeline] Completed in {elapsed:.2f}s")
 
-    if result.get("audio_buffer"):
+    # State persists across turns, so only report media produced by this turn's workflow
+    if result.get("workflow") == "audio" and result.get("audio_ref"):
         with open("demo_audio.mp3", "wb") as f:
-            f.write(result["audio_buffer"])
+            f.write(get_blob_store().get(result["audio_ref"]))
         print("[Audio saved]: demo_audio.mp3")
 
-    if result.get("image_path"):
-        print(f"[Image saved]: {result['image_path']}")
+    if result.get("workflow") == "image" and result.get("image_ref"):
+        print(f"[Image saved]: {get_blob_store().path(result['image_ref'])}")
 
-    return result["messages"]
+    summarizer.schedule(graph, "demo")
 
 
 if __name__ == "__main__":
@@ -45,15 +54,13 @@ if __name__ == "__main__":
     print("  - 'say that out loud' → voice note (saved as demo_audio.mp3)\n")
 
     async def loop():
-        history = []
         while True:
             user_input = input("You: ").strip()
             if user_input.lower() in ("quit", "exit"):
                 break
             if not user_input:
                 continue
-            history.append(HumanMessage(content=user_input))
-            history = await run(history)
+            await run(HumanMessage(content=user_input))
 
     asyncio.run(loop())
 
@@ -1,19 +1,12 @@
-from langgraph.graph import END
 from typing_extensions import Literal
 
 from graph.state import AICompanionState
 from settings import settings
 
 
-def should_summarize_conversation(
-    state: AICompanionState,
-) -> Literal["summarize_conversation_node", "__end__"]:
-    messages = state["messages"]
-
-    if len(messages) > settings.TOTAL_MESSAGES_SUMMARY_TRIGGER:
-        return "summarize_conversation_node"
-
-    return END
+def should_summarize_conversation(state: AICompanionState) -> bool:
+    """Whether the thread is long enough for the background summarizer to fold older messages."""
+    return len(state["messages"]) > settings.TOTAL_MESSAGES_SUMMARY_TRIGGER
 
 
 def select_workflow(
@@ -1,21 +1,26 @@
+import os
+from contextlib import asynccontextmanager
 from functools import lru_cache
+from typing import AsyncIterator
 
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.graph import END, START, StateGraph
+from langgraph.graph.state import CompiledStateGraph
 
-from graph.edges import (
-    select_workflow,
-    should_summarize_conversation,
-)
+from graph.edges import select_workflow
 from graph.nodes import (
+    FAN_OUT_NODES,
     audio_node,
+    context_join_node,
     conversation_node,
     image_node,
     memory_extraction_node,
     memory_injection_node,
     router_node,
-    summarize_conversation_node,
 )
 from graph.state import AICompanionState
+from modules.storage import configure_connection
+from settings import settings
 
 
 @lru_cache(maxsize=1)
@@ -25,21 +30,36 @@ def create_workflow_graph():
     graph_builder.add_node("memory_extraction_node", memory_extraction_node)
     graph_builder.add_node("router_node", router_node)
     graph_builder.add_node("memory_injection_node", memory_injection_node)
+    graph_builder.add_node("context_join_node", context_join_node)
     graph_builder.add_node("conversation_node", conversation_node)
     graph_builder.add_node("image_node", image_node)
     graph_builder.add_node("audio_node", audio_node)
-    graph_builder.add_node("summarize_conversation_node", summarize_conversation_node)
 
-    graph_builder.add_edge(START, "memory_extraction_node")
-    graph_builder.add_edge("memory_extraction_node", "router_node")
-    graph_builder.add_edge("router_node", "memory_injection_node")
-    graph_builder.add_conditional_edges("memory_injection_node", select_workflow)
-    graph_builder.add_conditional_edges("conversation_node", should_summarize_conversation)
-    graph_builder.add_conditional_edges("image_node", should_summarize_conversation)
-    graph_builder.add_conditional_edges("audio_node", should_summarize_conversation)
-    graph_builder.add_edge("summarize_conversation_node", END)
+    # Memory extraction, routing and memory retrieval only read the messages, so they run in parallel
+    for node in FAN_OUT_NODES:
+        graph_builder.add_edge(START, node)
+    graph_builder.add_edge(list(FAN_OUT_NODES), "context_join_node")
+    graph_builder.add_conditional_edges("context_join_node", select_workflow)
+    # Summarisation runs in the background after the reply (see graph.summarizer), never on this path
+    graph_builder.add_edge("conversation_node", END)
+    graph_builder.add_edge("image_node", END)
+    graph_builder.add_edge("audio_node", END)
 
     return graph_builder
 
 
-graph = create_workflow_graph().compile()
\ No newline at end of file
+@asynccontextmanager
+async def open_agent_graph(db_path: str = settings.SHORT_TERM_MEMORY_DB_PATH) -> AsyncIterator[CompiledStateGraph]:
+    """Compile the workflow graph once with a long-lived SQLite checkpointer.
+
+    The connection stays open for as long as the context is active, so callers should enter it once at
+    application startup and share the compiled graph across all requests.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    async with AsyncSqliteSaver.from_conn_string(db_path) as checkpointer:
+        # Only takes effect on a new database, and only before WAL is switched on; existing databases are converted
+        # offline by scripts/compact_checkpoints.py
+        await checkpointer.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await configure_connection(checkpointer.conn)
+        await checkpointer.setup()
+        yield create_workflow_graph().compile(checkpointer=checkpointer)
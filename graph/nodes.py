@@ -1,54 +1,106 @@
 import logging
 import os
 from pathlib import Path
+from typing import Tuple
 from uuid import uuid4
 
 # Absolute path to the project root (parent of the graph/ package)
 _PROJECT_ROOT = Path(__file__).resolve().parent.parent
 
-from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig
 
 from graph.state import AICompanionState
-from graph.utils.chains import get_audio_chain, get_conversation_chain, get_image_caption_chain, get_router_chain
+from graph.utils.chains import (
+    format_summary_context,
+    get_audio_chain,
+    get_conversation_chain,
+    get_image_caption_chain,
+    get_router_chain,
+)
+from graph.utils.context import get_context_builder
 from graph.utils.helpers import (
-    get_chat_model,
     get_image_to_text_module,
     get_text_to_image_module,
     get_text_to_speech_module,
+    timed_node,
 )
-from modules.memory.memory_manager import get_memory_manager
+from graph.utils.intent_classifier import get_intent_classifier
+from modules.memory import get_memory_extraction_queue, get_memory_manager
+from modules.storage import get_blob_store
+from prompts import AUDIO_PROMPT, CONVERSATION_PROMPT, IMAGE_CAPTION_PROMPT
 from settings import settings
 
 logger = logging.getLogger(__name__)
 
 
+def build_reply_inputs(node: str, state: AICompanionState, system_prompt: str, messages=None) -> Tuple[dict, int]:
+    """Pack messages, summary and memories into the token budget.
+
+    Returns the reply chain inputs and the estimated number of tokens they add up to.
+    """
+    window = get_context_builder().build(
+        state["messages"] if messages is None else messages,
+        summary=state.get("summary", ""),
+        memory_context=state.get("memory_context", ""),
+        system_prompt=system_prompt,
+    )
+    logger.info(
+        f"[{node}] Context: ~{window.tokens} tokens, {len(window.messages)} message(s) "
+        f"({window.dropped_messages} dropped to fit the budget)"
+    )
+    inputs = {
+        "messages": window.messages,
+        "memory_context": window.memory_context,
+        "summary_context": format_summary_context(window.summary),
+    }
+    return inputs, window.tokens
+
+
+def latest_turn_text(state: AICompanionState) -> str:
+    """Text of the trailing human messages, i.e. everything the user sent since the last reply.
+
+    This is usually one message, or several when the job queue coalesced a burst into one run.
+    """
+    turn = []
+    for message in reversed(state["messages"]):
+        if message.type != "human":
+            break
+        turn.append(message.content)
+    return "\n".join(reversed(turn))
+
+
+@timed_node("router_node")
 async def router_node(state: AICompanionState):
     logger.info("[router_node] Determining workflow...")
+    if settings.ROUTER_LOCAL_TIER:
+        result = await get_intent_classifier().classify(latest_turn_text(state))
+        if result.workflow:
+            logger.info(f"[router_node] Workflow selected locally ({result.tier}): '{result.workflow}'")
+            return {"workflow": result.workflow}
     chain = get_router_chain()
     response = await chain.ainvoke({"messages": state["messages"][-settings.ROUTER_MESSAGES_TO_ANALYZE:]})
     logger.info(f"[router_node] Workflow selected: '{response.response_type}'")
     return {"workflow": response.response_type}
 
 
+@timed_node("conversation_node")
 async def conversation_node(state: AICompanionState, config: RunnableConfig):
     logger.info("[conversation_node] Generating text response...")
     memory_context = state.get("memory_context", "")
     if memory_context:
         logger.info(f"[conversation_node] Memory context injected:\n{memory_context}")
-    chain = get_conversation_chain(state.get("summary", ""))
-    response = await chain.ainvoke(
-        {"messages": state["messages"], "memory_context": memory_context},
-        config,
-    )
+    chain = get_conversation_chain()
+    inputs, context_tokens = build_reply_inputs("conversation_node", state, CONVERSATION_PROMPT)
+    response = await chain.ainvoke(inputs, config)
     logger.info(f"[conversation_node] Response: {response[:120]}..." if len(response) > 120 else f"[conversation_node] Response: {response}")
-    return {"messages": AIMessage(content=response)}
+    return {"messages": AIMessage(content=response), "context_tokens": context_tokens}
 
 
+@timed_node("image_node")
 async def image_node(state: AICompanionState, config: RunnableConfig):
     logger.info("[image_node] Starting image generation flow...")
-    memory_context = state.get("memory_context", "")
-    chain = get_image_caption_chain(state.get("summary", ""))
+    chain = get_image_caption_chain()
     text_to_image_module = get_text_to_image_module()
 
     logger.info("[image_node] Creating image scenario from conversation...")
@@ -60,80 +112,56 @@ async def image_node(state: AICompanionState, config: RunnableConfig):
     img_path = str(img_dir / f"image_{str(uuid4())}.png")
     logger.info(f"[image_node] Calling RapidAPI Flux to generate image -> {img_path}")
     img_path = await text_to_image_module.generate_image(scenario.image_prompt, img_path)
-    logger.info(f"[image_node] Image saved: {img_path}")
+    image_ref = get_blob_store().put_file(img_path)
+    logger.info(f"[image_node] Image saved: {image_ref}")
 
     scenario_message = HumanMessage(content=f"<image generated from prompt: {scenario.image_prompt}>")
     updated_messages = state["messages"] + [scenario_message]
 
-    response = await chain.ainvoke(
-        {"messages": updated_messages, "memory_context": memory_context},
-        config,
-    )
+    inputs, context_tokens = build_reply_inputs("image_node", state, IMAGE_CAPTION_PROMPT, updated_messages)
+    response = await chain.ainvoke(inputs, config)
     logger.info(f"[image_node] Text response: {response[:120]}..." if len(response) > 120 else f"[image_node] Text response: {response}")
-    return {"messages": AIMessage(content=response), "image_path": img_path}
+    return {"messages": AIMessage(content=response), "image_ref": image_ref, "context_tokens": context_tokens}
 
 
+@timed_node("audio_node")
 async def audio_node(state: AICompanionState, config: RunnableConfig):
     logger.info("[audio_node] Generating audio response...")
-    memory_context = state.get("memory_context", "")
-    chain = get_audio_chain(state.get("summary", ""))
+    chain = get_audio_chain()
     text_to_speech_module = get_text_to_speech_module()
 
-    response = await chain.ainvoke(
-        {"messages": state["messages"], "memory_context": memory_context},
-        config,
-    )
+    inputs, context_tokens = build_reply_inputs("audio_node", state, AUDIO_PROMPT)
+    response = await chain.ainvoke(inputs, config)
     logger.info(f"[audio_node] Text to synthesize: {response[:120]}..." if len(response) > 120 else f"[audio_node] Text to synthesize: {response}")
     logger.info("[audio_node] Calling TTS...")
     output_audio = await text_to_speech_module.synthesize(response)
     logger.info(f"[audio_node] Audio generated: {len(output_audio)} bytes")
-    audio_dir = _PROJECT_ROOT / settings.GENERATED_AUDIO_DIR
-    audio_dir.mkdir(parents=True, exist_ok=True)
-    audio_path = str(audio_dir / f"audio_{str(uuid4())}.mp3")
-    with open(audio_path, "wb") as f:
-        f.write(output_audio)
-    logger.info(f"[audio_node] Audio saved: {audio_path}")
-    return {"messages": AIMessage(content=response), "audio_buffer": output_audio, "audio_path": audio_path}
-
-
-async def summarize_conversation_node(state: AICompanionState):
-    logger.info(f"[summarize_node] Message count ({len(state['messages'])}) exceeded threshold. Summarizing...")
-    model = get_chat_model()
-    summary = state.get("summary", "")
-
-    if summary:
-        summary_message = (
-            f"This is the summary of the conversation so far: {summary}\n\n"
-            "Extend the summary by taking into account the new messages above:"
-        )
-    else:
-        summary_message = (
-            "Create a summary of the conversation above. "
-            "The summary must be a short description capturing all relevant information shared:"
-        )
-
-    messages = state["messages"] + [HumanMessage(content=summary_message)]
-    response = await model.ainvoke(messages)
-    delete_messages = [RemoveMessage(id=m.id) for m in state["messages"][:-settings.TOTAL_MESSAGES_AFTER_SUMMARY]]
-    logger.info(f"[summarize_node] Summary updated. Removed {len(delete_messages)} old messages.")
-    return {"summary": response.content, "messages": delete_messages}
+    # Only the blob reference goes into the state, so the checkpoint never carries the MP3 bytes
+    audio_ref = get_blob_store().put(output_audio, "mp3")
+    logger.info(f"[audio_node] Audio saved: {audio_ref}")
+    return {"messages": AIMessage(content=response), "audio_ref": audio_ref, "context_tokens": context_tokens}
 
 
+@timed_node("memory_extraction_node")
 async def memory_extraction_node(state: AICompanionState):
-    logger.info("[memory_extraction_node] Analyzing last message for memory...")
+    logger.info("[memory_extraction_node] Queueing latest user messages for memory extraction...")
     if not state["messages"]:
         logger.info("[memory_extraction_node] No messages found, skipping.")
         return {}
-    memory_manager = get_memory_manager()
-    await memory_manager.extract_and_store_memories(state["messages"][-1])
+    content = latest_turn_text(state)
+    if content:
+        # One extraction job per turn, however many messages it holds. Analysis and storage run in the
+        # background; the reply never waits on them.
+        await get_memory_extraction_queue().submit(content)
     return {}
 
 
-def memory_injection_node(state: AICompanionState):
+@timed_node("memory_injection_node")
+async def memory_injection_node(state: AICompanionState):
     logger.info("[memory_injection_node] Retrieving relevant memories from Qdrant...")
     memory_manager = get_memory_manager()
     recent_context = " ".join([m.content for m in state["messages"][-3:]])
-    memories = memory_manager.get_relevant_memories(recent_context)
+    memories = await memory_manager.get_relevant_memories(recent_context)
     memory_context = memory_manager.format_memories_for_prompt(memories)
     if memory_context:
         logger.info(f"[memory_injection_node] Injecting {len(memories)} memories into context.")
@@ -141,3 +169,18 @@ def memory_injection_node(state: AICompanionState):
         logger.info("[memory_injection_node] No relevant memories found.")
     return {"memory_context": memory_context}
 
+
+FAN_OUT_NODES = ("memory_extraction_node", "router_node", "memory_injection_node")
+
+
+async def context_join_node(state: AICompanionState):
+    """Join point for the fan-out stages. Logs how much critical-path latency running them in parallel saved."""
+    timings = state.get("timings", {})
+    stages = [timings[name] for name in FAN_OUT_NODES if name in timings]
+    if stages:
+        sequential, critical_path = sum(stages), max(stages)
+        logger.info(
+            f"[context_join_node] Fan-out critical path {critical_path * 1000:.0f} ms "
+            f"vs {sequential * 1000:.0f} ms sequential (saved {(sequential - critical_path) * 1000:.0f} ms)"
+        )
+    return {}
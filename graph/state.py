@@ -1,5 +1,17 @@
+from typing import Annotated, Any, Dict
+
 from langgraph.graph import MessagesState
 
+# Key in `timings` naming the turn the timings belong to: the ID of the message that started it
+TIMINGS_TURN_KEY = "turn"
+
+
+def merge_timings(current: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """Reducer for `timings`: merge updates from the same turn, start over when a new turn reports."""
+    if (current or {}).get(TIMINGS_TURN_KEY) != update.get(TIMINGS_TURN_KEY):
+        return dict(update)
+    return {**current, **update}
+
 
 class AICompanionState(MessagesState):
     """State class for the AI Companion workflow.
@@ -10,12 +22,18 @@ class AICompanionState(MessagesState):
         last_message (AnyMessage): The most recent message in the conversation, can be any valid
             LangChain message type (HumanMessage, AIMessage, etc.)
         workflow (str): The current workflow the AI Companion is in. Can be "conversation", "image", or "audio".
-        audio_buffer (bytes): The audio buffer to be used for speech-to-text conversion.
+        audio_ref (str): Blob store reference of the audio generated in the latest audio turn.
+        image_ref (str): Blob store reference of the image generated in the latest image turn.
+        context_tokens (int): Estimated number of tokens the reply node sent to the LLM in the latest turn.
+        timings (Dict[str, Any]): Seconds spent in each node during the latest turn, plus the turn they belong to.
+            Merged within a turn, since the fan-out nodes report their timings in the same step, and reset by the
+            first node to report in a new turn.
     """
 
     summary: str
     workflow: str
-    audio_buffer: bytes
-    audio_path: str
-    image_path: str
-    memory_context: str
\ No newline at end of file
+    audio_ref: str
+    image_ref: str
+    memory_context: str
+    context_tokens: int
+    timings: Annotated[Dict[str, Any], merge_timings]
\ No newline at end of file
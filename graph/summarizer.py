@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import weakref
+from functools import lru_cache
+from typing import Dict, List, Set
+
+from langchain_core.messages import AnyMessage, HumanMessage, RemoveMessage
+from langgraph.graph.state import CompiledStateGraph
+
+from graph.edges import select_workflow, should_summarize_conversation
+from graph.utils.helpers import get_chat_model
+from settings import settings
+
+
+class ConversationSummarizer:
+    """Summarises conversation threads in the background, after the reply has been sent.
+
+    Only the messages that are about to be trimmed are folded into the running summary, so each message is sent to
+    the LLM for summarisation once. The LLM call happens outside any lock; the resulting summary and the
+    `RemoveMessage` trimming are then written as a single checkpoint update while holding the thread's lock, which
+    callers running the graph for that thread must also hold.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def thread_lock(self, thread_id: str) -> asyncio.Lock:
+        """Lock serialising graph runs and summary updates on one thread."""
+        lock = self._locks.get(thread_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[thread_id] = lock
+        return lock
+
+    def schedule(self, graph: CompiledStateGraph, thread_id: str) -> None:
+        """Summarise the thread in the background if it is long enough. Returns immediately."""
+        if thread_id in self._in_flight:
+            return
+        self._in_flight.add(thread_id)
+        task = asyncio.create_task(self._summarize(graph, thread_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self) -> None:
+        """Cancel summaries still running. Call before the checkpointer connection is closed."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if tasks:
+            self.logger.info(f"[summarizer] Cancelled {len(tasks)} summary task(s) at shutdown")
+
+    async def _summarize(self, graph: CompiledStateGraph, thread_id: str) -> None:
+        config = {"configurable": {"thread_id": thread_id}}
+        try:
+            snapshot = await graph.aget_state(config)
+            if not snapshot.values or not should_summarize_conversation(snapshot.values):
+                return
+
+            messages = snapshot.values["messages"]
+            to_fold = messages[: -settings.TOTAL_MESSAGES_AFTER_SUMMARY]
+            self.logger.info(f"[summarizer] Folding {len(to_fold)} message(s) of thread {thread_id} into the summary")
+            summary = await self._extend_summary(snapshot.values.get("summary", ""), to_fold)
+
+            async with self.thread_lock(thread_id):
+                # Re-read under the lock: only remove messages that are still there
+                current = await graph.aget_state(config)
+                present = {m.id for m in current.values.get("messages", [])}
+                await graph.aupdate_state(
+                    config,
+                    {"summary": summary, "messages": [RemoveMessage(id=m.id) for m in to_fold if m.id in present]},
+                    as_node=select_workflow(current.values),
+                )
+            self.logger.info(f"[summarizer] Summary of thread {thread_id} updated")
+        except Exception as e:
+            self.logger.error(f"[summarizer] Failed to summarise thread {thread_id}: {e}", exc_info=True)
+        finally:
+            self._in_flight.discard(thread_id)
+
+    async def _extend_summary(self, summary: str, messages: List[AnyMessage]) -> str:
+        if summary:
+            summary_message = (
+                f"This is the summary of the conversation so far: {summary}\n\n"
+                "Extend the summary by taking into account the new messages above:"
+            )
+        else:
+            summary_message = (
+                "Create a summary of the conversation above. "
+                "The summary must be a short description capturing all relevant information shared:"
+            )
+        response = await get_chat_model().ainvoke(list(messages) + [HumanMessage(content=summary_message)])
+        return response.content
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._in_flight)}
+
+
+@lru_cache
+def get_conversation_summarizer() -> ConversationSummarizer:
+    """Get or create the ConversationSummarizer singleton instance."""
+    return ConversationSummarizer()
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from pydantic import BaseModel, Field
 
@@ -11,48 +13,40 @@ class RouterResponse(BaseModel):
     )
 
 
-def get_router_chain():
-    model = get_chat_model(temperature=0.3).with_structured_output(RouterResponse)
-    prompt = ChatPromptTemplate.from_messages(
-        [("system", ROUTER_PROMPT), MessagesPlaceholder(variable_name="messages")]
-    )
-    return prompt | model
+def format_summary_context(summary: str = "") -> str:
+    """Value for the `summary_context` variable of the reply chains."""
+    return f"\n\nSummary of conversation so far: {summary}" if summary else ""
 
 
-def get_image_caption_chain(summary: str = ""):
-    system_message = IMAGE_CAPTION_PROMPT
-    if summary:
-        system_message += f"\n\nSummary of conversation so far: {summary}"
-    prompt = ChatPromptTemplate.from_messages(
+def _reply_prompt(system_message: str) -> ChatPromptTemplate:
+    # The summary is a template variable so the prompt (and the chain around it) is built once, not per summary
+    return ChatPromptTemplate.from_messages(
         [
-            ("system", system_message),
+            ("system", system_message + "{summary_context}"),
             MessagesPlaceholder(variable_name="messages"),
         ]
     )
-    return prompt | get_chat_model() | AsteriskRemovalParser()
 
 
-def get_audio_chain(summary: str = ""):
-    system_message = AUDIO_PROMPT
-    if summary:
-        system_message += f"\n\nSummary of conversation so far: {summary}"
+@lru_cache(maxsize=1)
+def get_router_chain():
+    model = get_chat_model(temperature=0.3).with_structured_output(RouterResponse)
     prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_message),
-            MessagesPlaceholder(variable_name="messages"),
-        ]
+        [("system", ROUTER_PROMPT), MessagesPlaceholder(variable_name="messages")]
     )
-    return prompt | get_chat_model() | AsteriskRemovalParser()
+    return prompt | model
 
 
-def get_conversation_chain(summary: str = ""):
-    system_message = CONVERSATION_PROMPT
-    if summary:
-        system_message += f"\n\nSummary of conversation so far: {summary}"
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_message),
-            MessagesPlaceholder(variable_name="messages"),
-        ]
-    )
-    return prompt | get_chat_model() | AsteriskRemovalParser()
+@lru_cache(maxsize=1)
+def get_image_caption_chain():
+    return _reply_prompt(IMAGE_CAPTION_PROMPT) | get_chat_model() | AsteriskRemovalParser()
+
+
+@lru_cache(maxsize=1)
+def get_audio_chain():
+    return _reply_prompt(AUDIO_PROMPT) | get_chat_model() | AsteriskRemovalParser()
+
+
+@lru_cache(maxsize=1)
+def get_conversation_chain():
+    return _reply_prompt(CONVERSATION_PROMPT) | get_chat_model() | AsteriskRemovalParser()
@@ -0,0 +1,118 @@
+import logging
+import math
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Sequence
+
+from langchain_core.messages import AnyMessage
+
+from settings import settings
+
+
+@dataclass
+class ContextWindow:
+    """What a reply node sends to the LLM, and its estimated size."""
+
+    messages: List[AnyMessage]
+    summary: str
+    memory_context: str
+    tokens: int
+    dropped_messages: int
+
+
+class ContextBuilder:
+    """Packs the most recent messages, the summary and the memories into a token budget.
+
+    Token counts are a fast character-based estimate (about four characters per token for English text), cached
+    per message so each message is only measured once across turns. The summary and the memories are capped at
+    their own share of the budget; the rest is filled with messages from newest to oldest. The latest message is
+    always kept, even if it alone exceeds the budget.
+    """
+
+    CHARS_PER_TOKEN = 4
+    MESSAGE_OVERHEAD = 4  # Role and separator tokens added per chat message
+
+    def __init__(self, budget: int, summary_max_tokens: int, memory_max_tokens: int, cache_size: int = 4096):
+        self.budget = budget
+        self.summary_max_tokens = summary_max_tokens
+        self.memory_max_tokens = memory_max_tokens
+        self.cache_size = cache_size
+        self.logger = logging.getLogger(__name__)
+        self._message_tokens: "OrderedDict[str, int]" = OrderedDict()
+        self._prompt_tokens: dict = {}
+
+    def count_tokens(self, text: str) -> int:
+        return math.ceil(len(text) / self.CHARS_PER_TOKEN)
+
+    def message_tokens(self, message: AnyMessage) -> int:
+        """Token estimate for a message, cached by message ID."""
+        key = message.id or str(hash(str(message.content)))
+        tokens = self._message_tokens.get(key)
+        if tokens is None:
+            tokens = self.count_tokens(str(message.content)) + self.MESSAGE_OVERHEAD
+            self._message_tokens[key] = tokens
+            if len(self._message_tokens) > self.cache_size:
+                self._message_tokens.popitem(last=False)
+        else:
+            self._message_tokens.move_to_end(key)
+        return tokens
+
+    def prompt_tokens(self, prompt: str) -> int:
+        """Token estimate for a static system prompt, computed once per prompt."""
+        if prompt not in self._prompt_tokens:
+            self._prompt_tokens[prompt] = self.count_tokens(prompt)
+        return self._prompt_tokens[prompt]
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        max_chars = max_tokens * self.CHARS_PER_TOKEN
+        return text if len(text) <= max_chars else text[:max_chars].rsplit(" ", 1)[0] + " ..."
+
+    def _fit_memories(self, memory_context: str) -> str:
+        # Memories are bullet lines ordered by relevance, so drop whole lines from the end
+        lines, used = [], 0
+        for line in memory_context.splitlines():
+            tokens = self.count_tokens(line) + 1
+            if used + tokens > self.memory_max_tokens:
+                break
+            lines.append(line)
+            used += tokens
+        return "\n".join(lines)
+
+    def build(
+        self,
+        messages: Sequence[AnyMessage],
+        summary: str = "",
+        memory_context: str = "",
+        system_prompt: str = "",
+    ) -> ContextWindow:
+        summary = self._truncate(summary, self.summary_max_tokens) if summary else ""
+        memory_context = self._fit_memories(memory_context) if memory_context else ""
+        used = self.prompt_tokens(system_prompt) + self.count_tokens(summary) + self.count_tokens(memory_context)
+
+        packed: List[AnyMessage] = []
+        for message in reversed(messages):
+            tokens = self.message_tokens(message)
+            if packed and used + tokens > self.budget:
+                break
+            packed.append(message)
+            used += tokens
+        packed.reverse()
+
+        return ContextWindow(
+            messages=packed,
+            summary=summary,
+            memory_context=memory_context,
+            tokens=used,
+            dropped_messages=len(messages) - len(packed),
+        )
+
+
+@lru_cache
+def get_context_builder() -> ContextBuilder:
+    """Get or create the ContextBuilder singleton instance."""
+    return ContextBuilder(
+        budget=settings.CONTEXT_TOKEN_BUDGET,
+        summary_max_tokens=settings.CONTEXT_SUMMARY_MAX_TOKENS,
+        memory_max_tokens=settings.CONTEXT_MEMORY_MAX_TOKENS,
+    )
@@ -1,30 +1,64 @@
+import functools
+import logging
 import re
+import time
+from functools import lru_cache
+from typing import Optional
 
+import httpx
 from langchain_core.output_parsers import StrOutputParser
 from langchain_groq import ChatGroq
 
 from modules.image.image_to_text import ImageToText
 from modules.image.text_to_image import TextToImage
 from modules.speech import TextToSpeech
+from graph.state import TIMINGS_TURN_KEY
 from settings import settings
 
+logger = logging.getLogger(__name__)
 
-def get_chat_model(temperature: float = 0.7):
+
+@lru_cache(maxsize=1)
+def get_groq_http_clients() -> tuple:
+    """Sync and async HTTP clients whose connection pools are shared by every ChatGroq instance."""
+    limits = httpx.Limits(
+        max_connections=settings.GROQ_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.GROQ_MAX_CONNECTIONS,
+    )
+    return httpx.Client(limits=limits), httpx.AsyncClient(limits=limits)
+
+
+def get_chat_model(temperature: float = 0.7, model_name: Optional[str] = None, max_retries: int = 2):
+    """Get the ChatGroq client for a temperature/model pair, created once and reused."""
+    # Resolve the defaults first: lru_cache keys on how the arguments were passed, so `get_chat_model()` and
+    # `get_chat_model(temperature=0.7)` would otherwise build two clients
+    return _get_chat_model(float(temperature), model_name or settings.TEXT_MODEL_NAME, max_retries)
+
+
+@lru_cache
+def _get_chat_model(temperature: float, model_name: str, max_retries: int):
+    http_client, http_async_client = get_groq_http_clients()
     return ChatGroq(
         api_key=settings.GROQ_API_KEY,
-        model_name=settings.TEXT_MODEL_NAME,
+        model_name=model_name,
         temperature=temperature,
+        max_retries=max_retries,
+        http_client=http_client,
+        http_async_client=http_async_client,
     )
 
 
+@lru_cache
 def get_text_to_speech_module():
     return TextToSpeech()
 
 
+@lru_cache
 def get_text_to_image_module():
     return TextToImage()
 
 
+@lru_cache
 def get_image_to_text_module():
     return ImageToText()
 
@@ -36,3 +70,26 @@ def remove_asterisk_content(text: str) -> str:
 class AsteriskRemovalParser(StrOutputParser):
     def parse(self, text: str) -> str:
         return remove_asterisk_content(super().parse(text))
+
+
+def timed_node(name: str):
+    """Record how long an async graph node takes under `timings[name]` in the state update.
+
+    The update is tagged with the ID of the message the node saw last, which is the same for every node of a run,
+    so the `timings` reducer drops the previous turn's entries.
+    """
+
+    def decorator(node):
+        @functools.wraps(node)
+        async def wrapper(state, *args, **kwargs):
+            start = time.perf_counter()
+            update = await node(state, *args, **kwargs)
+            elapsed = time.perf_counter() - start
+            logger.info(f"[timing] {name}: {elapsed * 1000:.0f} ms")
+            messages = state.get("messages") or [None]
+            turn = getattr(messages[-1], "id", None)
+            return {**(update or {}), "timings": {TIMINGS_TURN_KEY: turn, name: elapsed}}
+
+        return wrapper
+
+    return decorator
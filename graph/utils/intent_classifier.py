@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from modules.memory.vector_store import get_vector_store
+from prompts import ROUTER_EXAMPLES
+from settings import settings
+
+# Unambiguous requests for a generated image or a spoken reply. Only imperative requests at the start of a message
+# count ("draw me a fox", "can you send a picture of ..."): the same words inside ordinary chat ("I need to create a
+# presentation with images") are left to the other tiers.
+_REQUEST_START = r"^\W*(?:(?:hey|ok|okay|please|pls|now)\W+)*(?:(?:can|could|would|will) you\W+(?:please\W+)?)?"
+IMAGE_PATTERN = re.compile(
+    _REQUEST_START
+    + r"(?:(?:generate|create|make|draw|paint|sketch|render|design|send|show)\s+(?:me\s+|us\s+)?"
+    r"(?:a|an|some|another)\s+(?:(?!(?:with|of|for|and|about)\b)\w+\s+){0,2}?"
+    r"(?:image|picture|pic|photo|drawing|illustration|painting|portrait|wallpaper|logo|selfie)s?"
+    r"(?=\s+(?:of|for|showing|with|where|that|in)\b|\W*$)"
+    r"|(?:draw|sketch|paint)\s+(?:me\s+)?(?:a|an|the|some)\b)",
+    re.IGNORECASE | re.MULTILINE,
+)
+AUDIO_PATTERN = re.compile(
+    _REQUEST_START
+    + r"(?:(?:say|read|sing|speak|tell\s+me)\b.{0,40}\b(?:out\s+loud|aloud)\b"
+    r"|send\s+(?:me\s+|us\s+)?(?:a\s+|an\s+)?(?:voice|audio)\b"
+    r"|(?:reply|respond|answer)\s+(?:with|in|via|by)\s+(?:a\s+|an\s+)?(?:voice|audio)\b"
+    r"|(?:read|say)\s+(?:that|it|this)\s+(?:back|again)\b)",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Vision-model description appended to an incoming photo (see whatsapp_response.message_content). It describes
+# what is in the picture, not what the user asked for, so the local tiers never look at it.
+IMAGE_ANALYSIS_PATTERN = re.compile(r"\n?\[Image Analysis: .*?\](?=\n|$)", re.DOTALL)
+# Without any of these words a message is plainly a normal conversation turn. The list errs on the side of cues:
+# a false one only costs an embedding lookup, a missing one sends a media request to the conversation node.
+MEDIA_CUE_PATTERN = re.compile(
+    r"\b(image|picture|pic|photo|draw|paint|sketch|show|look|see|visual|render|generate|create|selfie|snap|"
+    r"portrait|wallpaper|illustrat|screenshot|camera|say|speak|voice|audio|read|sing|song|whisper|recite|narrat|"
+    r"pronounc|record|hear|listen|loud|aloud|tell)\w*\b|\b(hum|hums|humming|tune|shot|shots)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class IntentResult:
+    """Outcome of the local classifier. `workflow` is None when the message is ambiguous."""
+
+    workflow: Optional[str]
+    tier: str
+    score: float = 1.0
+
+
+class IntentClassifier:
+    """Local first tier of the router: regex rules, then embedding similarity against ROUTER_EXAMPLES.
+
+    Only messages that neither tier can classify confidently are left for the LLM router.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[str], Awaitable[np.ndarray]],
+        examples: Sequence[Tuple[str, str]] = ROUTER_EXAMPLES,
+        similarity_threshold: float = 0.6,
+        similarity_margin: float = 0.1,
+    ):
+        self.embed = embed
+        self.examples = list(examples)
+        self.similarity_threshold = similarity_threshold
+        self.similarity_margin = similarity_margin
+        self.logger = logging.getLogger(__name__)
+
+        self._example_matrix: Optional[np.ndarray] = None
+        self._example_labels: List[str] = [label for _, label in self.examples]
+        self._counts: Dict[str, int] = {"keyword": 0, "no_media_cue": 0, "embedding": 0, "llm": 0}
+
+    async def _examples(self) -> np.ndarray:
+        if self._example_matrix is None:
+            embeddings = await asyncio.gather(*(self.embed(text) for text, _ in self.examples))
+            matrix = np.stack(embeddings).astype(np.float32)
+            self._example_matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        return self._example_matrix
+
+    def classify_keywords(self, text: str) -> IntentResult:
+        """Rule-based tier. Returns a workflow for unambiguous messages, None otherwise."""
+        if IMAGE_PATTERN.search(text):
+            return IntentResult("image", "keyword")
+        if AUDIO_PATTERN.search(text):
+            return IntentResult("audio", "keyword")
+        if not MEDIA_CUE_PATTERN.search(text):
+            return IntentResult("conversation", "no_media_cue")
+        return IntentResult(None, "keyword")
+
+    async def classify_embedding(self, text: str) -> IntentResult:
+        """Nearest-example tier. Confident only if the best label clearly beats every other label."""
+        examples = await self._examples()
+        query = np.asarray(await self.embed(text), dtype=np.float32)
+        scores = examples @ (query / np.linalg.norm(query))
+
+        best_by_label: Dict[str, float] = {}
+        for label, score in zip(self._example_labels, scores):
+            best_by_label[label] = max(best_by_label.get(label, -1.0), float(score))
+        ranked = sorted(best_by_label.items(), key=lambda item: item[1], reverse=True)
+        label, best = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+
+        if best >= self.similarity_threshold and best - runner_up >= self.similarity_margin:
+            return IntentResult(label, "embedding", best)
+        return IntentResult(None, "embedding", best)
+
+    async def classify(self, text: str) -> IntentResult:
+        """Run the local tiers in order on the user's own words. A None workflow means the LLM router should decide."""
+        text = IMAGE_ANALYSIS_PATTERN.sub("", text)
+        result = self.classify_keywords(text)
+        if result.workflow is None:
+            result = await self.classify_embedding(text)
+        self._counts[result.tier if result.workflow else "llm"] += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """How many messages each tier answered, and the share left for the LLM."""
+        total = sum(self._counts.values())
+        return {
+            **self._counts,
+            "llm_call_rate": round(self._counts["llm"] / total, 4) if total else 0.0,
+        }
+
+
+@lru_cache
+def get_intent_classifier() -> IntentClassifier:
+    """Get or create the IntentClassifier singleton, reusing the vector store's MiniLM embeddings."""
+    return IntentClassifier(
+        embed=get_vector_store().embed,
+        similarity_threshold=settings.ROUTER_SIMILARITY_THRESHOLD,
+        similarity_margin=settings.ROUTER_SIMILARITY_MARGIN,
+    )
@@ -1,4 +1,5 @@
 from .image_to_text import ImageToText
 from .text_to_image import TextToImage, TextToImageError, ScenarioResponse
+from .vision_cache import VisionCache, get_vision_cache
 
-__all__ = ["ImageToText", "TextToImage", "TextToImageError", "ScenarioResponse"]
\ No newline at end of file
+__all__ = ["ImageToText", "TextToImage", "TextToImageError", "ScenarioResponse", "VisionCache", "get_vision_cache"]
\ No newline at end of file
@@ -1,10 +1,13 @@
+import asyncio
 import base64
 import logging
 import os
 from typing import Optional, Union
 
+from modules.image.preprocess import prepare_image
+from modules.image.vision_cache import get_vision_cache
 from settings import settings
-from groq import Groq
+from groq import AsyncGroq
 
 
 class ImageToText:
@@ -12,10 +15,13 @@ class ImageToText:
 
     REQUIRED_ENV_VARS = ["GROQ_API_KEY"]
 
+    # Shared across instances so the limit applies to the whole process
+    _semaphore: Optional[asyncio.Semaphore] = None
+
     def __init__(self):
         """Initialize the ImageToText class and validate environment variables."""
         self._validate_env_vars()
-        self._client: Optional[Groq] = None
+        self._client: Optional[AsyncGroq] = None
         self.logger = logging.getLogger(__name__)
 
     def _validate_env_vars(self) -> None:
@@ -23,12 +29,19 @@ class ImageToText:
             raise ValueError("Missing required environment variable: GROQ_API_KEY")
 
     @property
-    def client(self) -> Groq:
+    def client(self) -> AsyncGroq:
         """Get or create Groq client instance using singleton pattern."""
         if self._client is None:
-            self._client = Groq(api_key=settings.GROQ_API_KEY)
+            self._client = AsyncGroq(api_key=settings.GROQ_API_KEY)
         return self._client
 
+    @classmethod
+    def semaphore(cls) -> asyncio.Semaphore:
+        """Limit the number of vision calls in flight at once."""
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(settings.ITT_MAX_CONCURRENCY)
+        return cls._semaphore
+
     async def analyze_image(self, image_data: Union[str, bytes], prompt: str = "") -> str:
         """Analyze an image using Groq's vision capabilities.
 
@@ -56,13 +69,44 @@ class ImageToText:
             if not image_bytes:
                 raise ValueError("Image data cannot be empty")
 
-            # Convert image to base64
-            base64_image = base64.b64encode(image_bytes).decode("utf-8")
-
             # Default prompt if none provided
             if not prompt:
                 prompt = "Please describe what you see in this image in detail."
 
+            # Forwarded memes and stickers are often an image that was described before
+            cache = get_vision_cache()
+            try:
+                signature = await cache.signature(image_bytes)
+            except Exception as e:
+                self.logger.warning(f"Could not hash image, skipping the vision cache: {e}")
+                signature = None
+            if signature is not None:
+                description = await cache.get(signature, prompt)
+                if description is not None:
+                    self.logger.info("Reusing cached description for a previously seen image")
+                    return description
+
+            # Downscale and recompress off the event loop, and label the payload with its real format
+            try:
+                prepared = await asyncio.to_thread(
+                    prepare_image,
+                    image_bytes,
+                    max_side=settings.ITT_MAX_IMAGE_SIDE,
+                    max_bytes=settings.ITT_MAX_IMAGE_BYTES,
+                    quality=settings.ITT_JPEG_QUALITY,
+                )
+                payload, mime_type = prepared.data, prepared.mime_type
+                self.logger.info(
+                    f"Prepared {prepared.original_format} image: {prepared.original_size} -> {len(payload)} bytes, "
+                    f"{prepared.width}x{prepared.height}"
+                )
+            except Exception as e:
+                self.logger.warning(f"Could not preprocess image, sending it as is: {e}")
+                payload, mime_type = image_bytes, "image/jpeg"
+
+            # Convert image to base64
+            base64_image = base64.b64encode(payload).decode("utf-8")
+
             # Create the messages for the vision API
             messages = [
                 {
@@ -71,24 +115,28 @@ class ImageToText:
                         {"type": "text", "text": prompt},
                         {
                             "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
+                            "image_url": {"url": f"data:{mime_type};base64,{base64_image}"},
                         },
                     ],
                 }
             ]
 
             # Make the API call
-            response = self.client.chat.completions.create(
-                model=settings.ITT_MODEL_NAME,
-                messages=messages,
-                max_tokens=1000,
-            )
+            async with self.semaphore():
+                response = await self.client.chat.completions.create(
+                    model=settings.ITT_MODEL_NAME,
+                    messages=messages,
+                    max_tokens=1000,
+                    timeout=settings.ITT_TIMEOUT,
+                )
 
             if not response.choices:
                 raise ValueError("No response received from the vision model")
 
             description = response.choices[0].message.content
             self.logger.info(f"Generated image description: {description}")
+            if signature is not None:
+                await cache.put(signature, prompt, description)
 
             return description
 
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Formats the vision API accepts as they are
+PASSTHROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+MIN_JPEG_QUALITY = 45
+
+
+@dataclass
+class PreparedImage:
+    """Image bytes ready to send to the vision model."""
+
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_format: str
+    original_size: int
+
+
+def prepare_image(image_bytes: bytes, max_side: int = 1280, max_bytes: int = 1_000_000, quality: int = 85) -> PreparedImage:
+    """Detect the real format of an image, downscale it and recompress it to fit `max_side` and `max_bytes`.
+
+    Images that are already a supported format, small enough and within `max_bytes` are returned unchanged.
+    Everything else is converted to RGB JPEG at `quality`; if that is still over `max_bytes`, the quality and
+    then the resolution are stepped down until it fits. CPU bound: call it off the event loop.
+
+    Raises:
+        PIL.UnidentifiedImageError: If the bytes are not an image Pillow can read.
+    """
+    with Image.open(BytesIO(image_bytes)) as image:
+        original_format = image.format or "UNKNOWN"
+        if (
+            original_format in PASSTHROUGH_FORMATS
+            and max(image.size) <= max_side
+            and len(image_bytes) <= max_bytes
+            and not getattr(image, "is_animated", False)
+        ):
+            return PreparedImage(
+                image_bytes, PASSTHROUGH_FORMATS[original_format], *image.size, original_format, len(image_bytes)
+            )
+
+        # JPEGs are decoded straight at the nearest scale at or above the target, which skips most of the work
+        image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            # Flatten transparency (stickers) onto white rather than JPEG's default black
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        while True:
+            buffer = BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=True)
+            if buffer.tell() <= max_bytes:
+                break
+            if quality > MIN_JPEG_QUALITY:
+                quality = max(quality - 15, MIN_JPEG_QUALITY)
+            elif max(image.size) > 256:
+                image = image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.Resampling.LANCZOS)
+            else:
+                break
+
+        return PreparedImage(buffer.getvalue(), "image/jpeg", *image.size, original_format, len(image_bytes))
@@ -1,12 +1,12 @@
 import io
 import os
-from typing import List
+from typing import List, Optional
 
 import aiohttp
 from PIL import Image
 from langchain_core.messages import AnyMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_groq import ChatGroq
+from langchain_core.runnables import Runnable
 from pydantic import BaseModel, Field
 
 from settings import settings
@@ -38,22 +38,41 @@ class TextToImageError(Exception):
 class TextToImage:
     """Generate images from text prompts using Pollinations.ai (free, no API key)."""
 
-    async def create_scenario(self, messages: List[AnyMessage]) -> ScenarioResponse:
-        model = ChatGroq(
-            api_key=settings.GROQ_API_KEY,
-            model_name=settings.TEXT_MODEL_NAME,
-            temperature=0.7,
-        ).with_structured_output(ScenarioResponse)
-
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SCENARIO_PROMPT),
-                MessagesPlaceholder(variable_name="messages"),
-            ]
-        )
+    _session: Optional[aiohttp.ClientSession] = None
+    _scenario_chain: Optional[Runnable] = None
+
+    @classmethod
+    def session(cls) -> aiohttp.ClientSession:
+        """Get or create the aiohttp session shared by all instances."""
+        if cls._session is None or cls._session.closed:
+            cls._session = aiohttp.ClientSession()
+        return cls._session
+
+    @classmethod
+    async def close(cls) -> None:
+        """Close the shared aiohttp session."""
+        if cls._session is not None:
+            await cls._session.close()
+            cls._session = None
+
+    @classmethod
+    def scenario_chain(cls) -> Runnable:
+        """Get or create the scenario chain shared by all instances."""
+        if cls._scenario_chain is None:
+            from graph.utils.helpers import get_chat_model  # lazy import: graph.utils imports the modules package
+
+            model = get_chat_model(temperature=0.7).with_structured_output(ScenarioResponse)
+            prompt = ChatPromptTemplate.from_messages(
+                [
+                    ("system", SCENARIO_PROMPT),
+                    MessagesPlaceholder(variable_name="messages"),
+                ]
+            )
+            cls._scenario_chain = prompt | model
+        return cls._scenario_chain
 
-        chain = prompt | model
-        return await chain.ainvoke({"messages": messages})
+    async def create_scenario(self, messages: List[AnyMessage]) -> ScenarioResponse:
+        return await self.scenario_chain().ainvoke({"messages": messages})
 
     async def generate_image(self, image_prompt: str, output_path: str) -> str:
         """Generate an image via RapidAPI Flux and save it to output_path.
@@ -73,42 +92,42 @@ class TextToImage:
         payload = {"prompt": image_prompt, "style_id": 4, "size": "1-1"}
 
         try:
-            async with aiohttp.ClientSession() as session:
-                # Step 1: request image generation
-                async with session.post(
-                    RAPIDAPI_TTI_URL,
-                    headers=headers,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=60),
-                ) as resp:
-                    if resp.status != 200:
-                        body = await resp.text()
-                        raise TextToImageError(
-                            f"RapidAPI returned HTTP {resp.status}: {body[:200]}"
-                        )
-                    data = await resp.json()
-
-                # Step 2: pick first non-NSFW image URL
-                results = data.get("final_result", [])
-                if not results:
-                    raise TextToImageError("RapidAPI returned no images.")
-
-                image_url = next(
-                    (r["origin"] for r in results if not r.get("nsfw", False)),
-                    None,
-                )
-                if not image_url:
-                    raise TextToImageError("All returned images were flagged as NSFW.")
-
-                # Step 3: download the webp
-                async with session.get(
-                    image_url, timeout=aiohttp.ClientTimeout(total=60)
-                ) as img_resp:
-                    if img_resp.status != 200:
-                        raise TextToImageError(
-                            f"Failed to download image: HTTP {img_resp.status}"
-                        )
-                    image_bytes = await img_resp.read()
+            session = self.session()
+            # Step 1: request image generation
+            async with session.post(
+                RAPIDAPI_TTI_URL,
+                headers=headers,
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=60),
+            ) as resp:
+                if resp.status != 200:
+                    body = await resp.text()
+                    raise TextToImageError(
+                        f"RapidAPI returned HTTP {resp.status}: {body[:200]}"
+                    )
+                data = await resp.json()
+
+            # Step 2: pick first non-NSFW image URL
+            results = data.get("final_result", [])
+            if not results:
+                raise TextToImageError("RapidAPI returned no images.")
+
+            image_url = next(
+                (r["origin"] for r in results if not r.get("nsfw", False)),
+                None,
+            )
+            if not image_url:
+                raise TextToImageError("All returned images were flagged as NSFW.")
+
+            # Step 3: download the webp
+            async with session.get(
+                image_url, timeout=aiohttp.ClientTimeout(total=60)
+            ) as img_resp:
+                if img_resp.status != 200:
+                    raise TextToImageError(
+                        f"Failed to download image: HTTP {img_resp.status}"
+                    )
+                image_bytes = await img_resp.read()
 
             if not image_bytes:
                 raise TextToImageError("Downloaded image is empty.")
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from io import BytesIO
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import aiosqlite
+from PIL import Image
+
+from modules.storage import configure_connection
+from settings import settings
+
+FINE_HASH_SIZE = 16  # 256-bit hash used to confirm a near match
+ASPECT_TOLERANCE = 0.02  # Relative difference in aspect ratio allowed for a near match
+
+
+def _dhash_gray(image: Image.Image, hash_size: int) -> int:
+    """Difference hash of a grayscale image: one bit per adjacent-pixel brightness comparison on a tiny copy.
+
+    Re-encoding, resizing and small edits flip few or no bits, so near-identical images have a small Hamming
+    distance between their hashes.
+    """
+    pixels = image.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS).tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+@dataclass
+class ImageSignature:
+    """What the cache knows about an image: its exact content hash and, for near matching, its perceptual hashes."""
+
+    content_hash: str
+    image_hash: Optional[int] = None  # 64-bit dHash
+    fine_hash: Optional[int] = None  # 256-bit dHash
+    aspect: Optional[float] = None  # Width over height
+
+    @property
+    def perceptual(self) -> bool:
+        return self.image_hash is not None
+
+
+def image_signature(image_bytes: bytes, perceptual: bool = True) -> ImageSignature:
+    """SHA-256 of the bytes, plus the 64- and 256-bit dHashes and aspect ratio when `perceptual` is set."""
+    signature = ImageSignature(hashlib.sha256(image_bytes).hexdigest())
+    if perceptual:
+        with Image.open(BytesIO(image_bytes)) as image:
+            width, height = image.size
+            # JPEGs can be decoded straight at a fraction of their size, which is most of the cost for large photos
+            image.draft("L", (FINE_HASH_SIZE * 8, FINE_HASH_SIZE * 8))
+            gray = image.convert("L")
+        signature.image_hash = _dhash_gray(gray, 8)
+        signature.fine_hash = _dhash_gray(gray, FINE_HASH_SIZE)
+        signature.aspect = width / height
+    return signature
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class _Entry(NamedTuple):
+    image_hash: Optional[int]
+    fine_hash: Optional[int]
+    aspect: Optional[float]
+    description: str
+
+
+class VisionCache:
+    """Cache of vision-model descriptions keyed by the image content and the prompt.
+
+    The cache is shared by every user, so by default a description is only reused for a byte-identical image (a
+    forwarded meme or sticker). With `tolerance` above 0, an image whose 64-bit dHash is within `tolerance` bits of a
+    cached one also hits, but only if its 256-bit dHash is within `4 * tolerance` bits and its aspect ratio matches
+    too: screenshots and receipts with the same layout often share a coarse hash, and must never get someone else's
+    description. Entries are kept in memory for the lookup scan and mirrored in SQLite so they survive restarts. At
+    most `max_entries` are kept, evicting the least recently used.
+    """
+
+    def __init__(self, db_path: str, model: str, tolerance: int = 0, max_entries: int = 5000):
+        self.db_path = db_path
+        self.model = model
+        self.tolerance = tolerance
+        self.max_entries = max_entries
+        self.logger = logging.getLogger(__name__)
+
+        self._db: Optional[aiosqlite.Connection] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+
+        self._exact_hits = 0
+        self._near_hits = 0
+        self._rejected_near = 0
+        self._misses = 0
+        self._evictions = 0
+
+    async def start(self) -> None:
+        """Open the table and load the most recently used entries."""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._db is not None:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            db = await aiosqlite.connect(self.db_path)
+            await configure_connection(db)
+            # Entries of the first version were keyed by the coarse hash alone, which is not safe to share
+            await db.execute("DROP TABLE IF EXISTS vision_descriptions")
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS vision_cache_entries (
+                    prompt_key TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    image_hash INTEGER,
+                    fine_hash TEXT,
+                    aspect REAL,
+                    description TEXT NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    PRIMARY KEY (prompt_key, content_hash)
+                )
+                """
+            )
+            await db.commit()
+            async with db.execute(
+                "SELECT prompt_key, content_hash, image_hash, fine_hash, aspect, description FROM vision_cache_entries "
+                "ORDER BY last_used_at DESC LIMIT ?",
+                (self.max_entries,),
+            ) as cursor:
+                rows = await cursor.fetchall()
+            for prompt_key, content_hash, image_hash, fine_hash, aspect, description in reversed(rows):
+                self._entries[(prompt_key, content_hash)] = _Entry(
+                    image_hash & ((1 << 64) - 1) if image_hash is not None else None,
+                    int(fine_hash, 16) if fine_hash is not None else None,
+                    aspect,
+                    description,
+                )
+            self._db = db
+
+    async def stop(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def signature(self, image_bytes: bytes) -> ImageSignature:
+        """Signature of an image, computed off the event loop. The image is only decoded when near matching is on."""
+        return await asyncio.to_thread(image_signature, image_bytes, self.tolerance > 0)
+
+    def _prompt_key(self, prompt: str) -> str:
+        return hashlib.sha256(f"{self.model}\n{prompt}".encode()).hexdigest()[:32]
+
+    def _confirms(self, entry: _Entry, signature: ImageSignature) -> bool:
+        """Second check on a coarse-hash match: the fine hash and the aspect ratio must agree as well."""
+        if entry.fine_hash is None or entry.aspect is None:
+            return False
+        if (entry.fine_hash ^ signature.fine_hash).bit_count() > self.tolerance * 4:
+            return False
+        return abs(entry.aspect - signature.aspect) <= ASPECT_TOLERANCE * signature.aspect
+
+    def _nearest(self, prompt_key: str, signature: ImageSignature) -> Optional[Tuple[str, str]]:
+        best_key, best_distance = None, self.tolerance + 1
+        for key, entry in self._entries.items():
+            if key[0] != prompt_key or entry.image_hash is None:
+                continue
+            distance = (entry.image_hash ^ signature.image_hash).bit_count()
+            if distance < best_distance:
+                if self._confirms(entry, signature):
+                    best_key, best_distance = key, distance
+                else:
+                    self._rejected_near += 1
+        return best_key
+
+    async def get(self, signature: ImageSignature, prompt: str) -> Optional[str]:
+        """Description of the same image for the same prompt, or of a confirmed near match when enabled."""
+        await self.start()
+        key = (self._prompt_key(prompt), signature.content_hash)
+        if key in self._entries:
+            self._exact_hits += 1
+        elif self.tolerance > 0 and signature.perceptual and (key := self._nearest(key[0], signature)) is not None:
+            self._near_hits += 1
+        else:
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        description = self._entries[key].description
+        await self._db.execute(
+            "UPDATE vision_cache_entries SET last_used_at = ? WHERE prompt_key = ? AND content_hash = ?",
+            (time.time(), *key),
+        )
+        await self._db.commit()
+        return description
+
+    async def put(self, signature: ImageSignature, prompt: str, description: str) -> None:
+        """Store a description and evict the least recently used entries over the limit."""
+        await self.start()
+        key = (self._prompt_key(prompt), signature.content_hash)
+        self._entries[key] = _Entry(signature.image_hash, signature.fine_hash, signature.aspect, description)
+        self._entries.move_to_end(key)
+        await self._db.execute(
+            "INSERT OR REPLACE INTO vision_cache_entries "
+            "(prompt_key, content_hash, image_hash, fine_hash, aspect, description, last_used_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                *key,
+                _to_signed(signature.image_hash) if signature.image_hash is not None else None,
+                f"{signature.fine_hash:064x}" if signature.fine_hash is not None else None,
+                signature.aspect,
+                description,
+                time.time(),
+            ),
+        )
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False)[0])
+        if evicted:
+            self._evictions += len(evicted)
+            await self._db.executemany(
+                "DELETE FROM vision_cache_entries WHERE prompt_key = ? AND content_hash = ?", evicted
+            )
+        await self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Exact and near-duplicate hits, near matches rejected by the second check, misses and evictions."""
+        hits = self._exact_hits + self._near_hits
+        lookups = hits + self._misses
+        return {
+            "exact_hits": self._exact_hits,
+            "near_hits": self._near_hits,
+            "rejected_near_matches": self._rejected_near,
+            "misses": self._misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "evictions": self._evictions,
+            "tolerance_bits": self.tolerance,
+        }
+
+
+@lru_cache
+def get_vision_cache() -> VisionCache:
+    """Get or create the VisionCache singleton instance."""
+    return VisionCache(
+        db_path=settings.VISION_CACHE_DB_PATH,
+        model=settings.ITT_MODEL_NAME,
+        tolerance=settings.VISION_CACHE_HAMMING_TOLERANCE,
+        max_entries=settings.VISION_CACHE_MAX_ENTRIES,
+    )
@@ -1,3 +1,4 @@
+from .extraction_queue import MemoryExtractionQueue, get_memory_extraction_queue
 from .memory_manager import MemoryManager, get_memory_manager
 
-__all__ = ["MemoryManager", "get_memory_manager"]
+__all__ = ["MemoryExtractionQueue", "MemoryManager", "get_memory_extraction_queue", "get_memory_manager"]
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+
+class EmbeddingService:
+    """Micro-batching front end for a SentenceTransformer model.
+
+    Concurrent `embed` calls are collected for up to `max_wait_ms` (or until `max_batch_size` texts are waiting)
+    and encoded together in a single `encode` call on a dedicated worker thread, so the event loop is never
+    blocked and the model runs on full batches instead of one text at a time.
+    """
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.logger = logging.getLogger(__name__)
+
+        # A single thread: encodes are CPU bound, running batches side by side would only contend for cores
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self._batches = 0
+        self._items = 0
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embed a single text as part of the next batch."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    async def embed_many(self, texts: Sequence[str]) -> List[np.ndarray]:
+        """Embed several texts; they share batches with any other concurrent callers."""
+        return list(await asyncio.gather(*(self.embed(text) for text in texts)))
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending[: self.max_batch_size], self._pending[self.max_batch_size :]
+        if self._pending:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        if batch:
+            task = asyncio.create_task(self._encode_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _encode_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        texts = [text for text, _ in batch]
+        try:
+            embeddings = await asyncio.get_running_loop().run_in_executor(
+                self._executor, lambda: self.model.encode(texts, batch_size=len(texts))
+            )
+        except Exception as e:
+            self.logger.error(f"[embedding_service] Batch of {len(texts)} failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._batches += 1
+        self._items += len(texts)
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of batches run and their average size."""
+        return {
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
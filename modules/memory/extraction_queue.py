@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional
+
+import aiosqlite
+from langchain_core.messages import HumanMessage
+
+from modules.memory.memory_manager import get_memory_manager
+from modules.storage import configure_connection
+from settings import settings
+
+
+class MemoryExtractionQueue:
+    """Background stage that analyses messages and stores memories outside the reply path.
+
+    Submitted messages are written to a SQLite table before they are queued, retried with exponential backoff
+    when the LLM or Qdrant fails, and only deleted once stored. Anything left over (including messages that used up
+    their `max_retries` for this run) is picked up again on the next start, until a message has failed
+    `max_attempts` times in total; it is then dropped, so one message the LLM can never handle is not retried on
+    every restart forever.
+    """
+
+    LAG_SAMPLES = 1000  # Number of recent submit-to-stored lags kept for stats
+
+    def __init__(
+        self,
+        db_path: str,
+        concurrency: int = 2,
+        max_retries: int = 5,
+        retry_delay: float = 2.0,
+        max_attempts: int = 15,
+    ):
+        self.db_path = db_path
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger(__name__)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._db: Optional[aiosqlite.Connection] = None
+        self._tasks: List[asyncio.Task] = []
+        self._start_lock: Optional[asyncio.Lock] = None
+
+        self._in_flight = 0
+        self._stored = 0
+        self._failed = 0
+        self._dropped = 0
+        self._retries = 0
+        self._lags: Deque[float] = deque(maxlen=self.LAG_SAMPLES)
+
+    @property
+    def started(self) -> bool:
+        return self._queue is not None
+
+    async def start(self) -> None:
+        """Open the table, start the workers and re-queue messages left over from a previous run."""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.started:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._db = await aiosqlite.connect(self.db_path)
+            await configure_connection(self._db)
+            await self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS memory_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    content TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            await self._db.commit()
+
+            cursor = await self._db.execute("DELETE FROM memory_jobs WHERE attempts >= ?", (self.max_attempts,))
+            await self._db.commit()
+            if cursor.rowcount:
+                self._dropped += cursor.rowcount
+                self.logger.error(
+                    f"[memory_queue] Dropped {cursor.rowcount} memory job(s) that failed {self.max_attempts} times"
+                )
+
+            queue: asyncio.Queue = asyncio.Queue()
+            async with self._db.execute(
+                "SELECT id, content, created_at, attempts FROM memory_jobs ORDER BY id"
+            ) as cursor:
+                rows = await cursor.fetchall()
+            for row in rows:
+                queue.put_nowait(tuple(row))
+            if rows:
+                self.logger.info(f"[memory_queue] Recovered {len(rows)} unfinished memory job(s)")
+
+            self._queue = queue
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        """Stop the workers. Unfinished messages stay in the table for the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def submit(self, content: str) -> None:
+        """Persist a message for memory extraction and queue it. Returns without waiting for the LLM."""
+        if not self.started:
+            await self.start()
+        created_at = time.time()
+        cursor = await self._db.execute(
+            "INSERT INTO memory_jobs (content, created_at) VALUES (?, ?)", (content, created_at)
+        )
+        await self._db.commit()
+        self._queue.put_nowait((cursor.lastrowid, content, created_at, 0))
+
+    async def _worker(self) -> None:
+        memory_manager = get_memory_manager()
+        while True:
+            job_id, content, created_at, attempts = await self._queue.get()
+            self._in_flight += 1
+            try:
+                await self._process(memory_manager, job_id, content, created_at, attempts)
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _process(self, memory_manager, job_id: int, content: str, created_at: float, attempts: int) -> None:
+        # `attempts` counts failures in earlier runs; this run gets up to `max_retries` more within the total cap
+        last_attempt = min(attempts + self.max_retries, self.max_attempts)
+        for attempt in range(attempts + 1, last_attempt + 1):
+            try:
+                await memory_manager.extract_and_store_memories(HumanMessage(content=content))
+                await self._db.execute("DELETE FROM memory_jobs WHERE id = ?", (job_id,))
+                await self._db.commit()
+                self._stored += 1
+                self._lags.append(time.time() - created_at)
+                return
+            except Exception as e:
+                await self._db.execute(
+                    "UPDATE memory_jobs SET attempts = attempts + 1, error = ? WHERE id = ?", (str(e), job_id)
+                )
+                await self._db.commit()
+                if attempt == last_attempt:
+                    break
+                self._retries += 1
+                delay = self.retry_delay * 2 ** (attempt - attempts - 1)
+                self.logger.warning(f"[memory_queue] Job {job_id} failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+        self._failed += 1
+        if last_attempt >= self.max_attempts:
+            self._dropped += 1
+            await self._db.execute("DELETE FROM memory_jobs WHERE id = ?", (job_id,))
+            await self._db.commit()
+            self.logger.error(f"[memory_queue] Job {job_id} failed {last_attempt} times in total, dropping it")
+            return
+        await self._db.execute("UPDATE memory_jobs SET status = 'failed' WHERE id = ?", (job_id,))
+        await self._db.commit()
+        self.logger.error(f"[memory_queue] Job {job_id} failed after {last_attempt - attempts} attempts, kept for next start")
+
+    def stats(self) -> Dict[str, Any]:
+        """Backlog size, outcomes and submit-to-stored lag."""
+        lags = sorted(self._lags)
+        return {
+            "pending": self._queue.qsize() if self._queue else 0,
+            "in_flight": self._in_flight,
+            "stored": self._stored,
+            "failed": self._failed,
+            "dropped": self._dropped,
+            "retries": self._retries,
+            "lag_seconds_avg": round(sum(lags) / len(lags), 3) if lags else 0.0,
+            "lag_seconds_p95": round(lags[min(len(lags) - 1, int(len(lags) * 0.95))], 3) if lags else 0.0,
+        }
+
+
+@lru_cache
+def get_memory_extraction_queue() -> MemoryExtractionQueue:
+    """Get or create the MemoryExtractionQueue singleton instance."""
+    return MemoryExtractionQueue(
+        db_path=settings.MEMORY_QUEUE_DB_PATH,
+        concurrency=settings.MEMORY_EXTRACTION_CONCURRENCY,
+        max_retries=settings.MEMORY_EXTRACTION_MAX_RETRIES,
+        retry_delay=settings.MEMORY_EXTRACTION_RETRY_DELAY,
+        max_attempts=settings.MEMORY_EXTRACTION_MAX_ATTEMPTS,
+    )
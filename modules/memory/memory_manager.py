@@ -1,13 +1,13 @@
 import logging
 import uuid
 from datetime import datetime
+from functools import lru_cache
 from typing import List, Optional
 
 from prompts import MEMORY_ANALYSIS_PROMPT
 from modules.memory.vector_store import get_vector_store
 from settings import settings
 from langchain_core.messages import BaseMessage
-from langchain_groq import ChatGroq
 from pydantic import BaseModel, Field
 
 
@@ -27,12 +27,9 @@ class MemoryManager:
     def __init__(self):
         self.vector_store = get_vector_store()
         self.logger = logging.getLogger(__name__)
-        self.llm = ChatGroq(
-            model=settings.TEXT_MODEL_NAME,
-            api_key=settings.GROQ_API_KEY,
-            temperature=0.1,
-            max_retries=2,
-        ).with_structured_output(MemoryAnalysis)
+        from graph.utils.helpers import get_chat_model  # lazy import: graph.utils imports the modules package
+
+        self.llm = get_chat_model(temperature=0.1).with_structured_output(MemoryAnalysis)
 
     async def _analyze_memory(self, message: str) -> MemoryAnalysis:
         """Analyze a message to determine importance and format if needed."""
@@ -47,26 +44,22 @@ class MemoryManager:
         # Analyze the message for importance and formatting
         analysis = await self._analyze_memory(message.content)
         if analysis.is_important and analysis.formatted_memory:
-            # Check if similar memory exists
-            similar = self.vector_store.find_similar_memory(analysis.formatted_memory)
-            if similar:
-                # Skip storage if we already have a similar memory
-                self.logger.info(f"Similar memory already exists: '{analysis.formatted_memory}'")
-                return
-
-            # Store new memory
-            self.logger.info(f"Storing new memory: '{analysis.formatted_memory}'")
-            self.vector_store.store_memory(
+            # Store new memory, or refresh a similar one in place
+            updated = await self.vector_store.store_memory(
                 text=analysis.formatted_memory,
                 metadata={
                     "id": str(uuid.uuid4()),
                     "timestamp": datetime.now().isoformat(),
                 },
             )
+            if updated:
+                self.logger.info(f"Updated similar memory '{updated.text}' -> '{analysis.formatted_memory}'")
+            else:
+                self.logger.info(f"Stored new memory: '{analysis.formatted_memory}'")
 
-    def get_relevant_memories(self, context: str) -> List[str]:
+    async def get_relevant_memories(self, context: str) -> List[str]:
         """Retrieve relevant memories based on the current context."""
-        memories = self.vector_store.search_memories(context, k=settings.MEMORY_TOP_K)
+        memories = await self.vector_store.search_memories(context, k=settings.MEMORY_TOP_K)
         if memories:
             for memory in memories:
                 self.logger.debug(f"Memory: '{memory.text}' (score: {memory.score:.2f})")
@@ -79,6 +72,7 @@ class MemoryManager:
         return "\n".join(f"- {memory}" for memory in memories)
 
 
+@lru_cache
 def get_memory_manager() -> MemoryManager:
-    """Get a MemoryManager instance."""
+    """Get or create the MemoryManager singleton instance."""
     return MemoryManager()
\ No newline at end of file
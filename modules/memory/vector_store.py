@@ -1,12 +1,25 @@
+import asyncio
+import hashlib
+import logging
 import os
+import re
+import unicodedata
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime
 from functools import lru_cache
-from typing import List, Optional
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
 
+import numpy as np
+
+from modules.memory.embedding_service import EmbeddingService
 from settings import settings
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, PointStruct, VectorParams
+from qdrant_client.http.exceptions import UnexpectedResponse
+from qdrant_client.models import Distance, PointStruct, SearchRequest, VectorParams
+
+
+T = TypeVar("T")
 
 
 @dataclass
@@ -27,6 +40,82 @@ class Memory:
         return datetime.fromisoformat(ts) if ts else None
 
 
+class EmbeddingCache:
+    """Bounded LRU cache of embeddings keyed by a hash of the normalised text.
+
+    Keys are 16-byte BLAKE2b digests and values float32 arrays, so an entry for a MiniLM embedding costs about
+    1.5 KB. The cache can optionally be saved to and loaded from an .npz file to survive restarts.
+    """
+
+    def __init__(self, max_entries: int = 10000, persist_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self.logger = logging.getLogger(__name__)
+        self._entries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Unicode-normalise, lowercase and collapse whitespace. all-MiniLM-L6-v2 is uncased, so case is irrelevant."""
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+    @classmethod
+    def key(cls, text: str) -> bytes:
+        return hashlib.blake2b(cls.normalize(text).encode("utf-8"), digest_size=16).digest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.key(text)
+        embedding = self._entries.get(key)
+        if embedding is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return embedding
+
+    def put(self, text: str, embedding: np.ndarray) -> None:
+        key = self.key(text)
+        self._entries[key] = np.asarray(embedding, dtype=np.float32)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def load(self) -> None:
+        """Load persisted entries, if a persist path is configured and the file exists."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with np.load(self.persist_path) as data:
+                for key, embedding in zip(data["keys"], data["embeddings"]):
+                    self._entries[key.tobytes()] = embedding
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.logger.info(f"Loaded {len(self._entries)} cached embeddings from {self.persist_path}")
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable embedding cache {self.persist_path}: {e}")
+
+    def save(self) -> None:
+        """Persist the cache, if a persist path is configured."""
+        if not self.persist_path or not self._entries:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+        keys = np.frombuffer(b"".join(self._entries.keys()), dtype=np.uint8).reshape(-1, 16)
+        tmp_path = f"{self.persist_path}.tmp.npz"
+        np.savez(tmp_path, keys=keys, embeddings=np.stack(list(self._entries.values())))
+        os.replace(tmp_path, self.persist_path)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
 class VectorStore:
     """A class to handle vector storage operations using Qdrant."""
 
@@ -48,7 +137,16 @@ class VectorStore:
             self._validate_env_vars()
             from sentence_transformers import SentenceTransformer  # lazy import to avoid slow torch load at startup
             self.model = SentenceTransformer(self.EMBEDDING_MODEL)
+            self.embedder = EmbeddingService(
+                self.model,
+                max_batch_size=settings.EMBEDDING_BATCH_SIZE,
+                max_wait_ms=settings.EMBEDDING_MAX_WAIT_MS,
+            )
+            self.embedding_cache = EmbeddingCache(settings.EMBEDDING_CACHE_SIZE, settings.EMBEDDING_CACHE_PATH)
+            self.embedding_cache.load()
             self.client = QdrantClient(url=settings.QDRANT_URL, api_key=settings.QDRANT_API_KEY)
+            self._collection_ready = False
+            self._ensure_collection()
             self._initialized = True
 
     def _validate_env_vars(self) -> None:
@@ -62,65 +160,114 @@ class VectorStore:
 
     def _collection_exists(self) -> bool:
         """Check if the memory collection exists."""
-        collections = self.client.get_collections().collections
-        return any(col.name == self.COLLECTION_NAME for col in collections)
+        return self.client.collection_exists(self.COLLECTION_NAME)
 
     def _create_collection(self) -> None:
         """Create a new collection for storing memories."""
-        sample_embedding = self.model.encode("sample text")
         self.client.create_collection(
             collection_name=self.COLLECTION_NAME,
             vectors_config=VectorParams(
-                size=len(sample_embedding),
+                size=self.model.get_sentence_embedding_dimension(),
                 distance=Distance.COSINE,
             ),
         )
 
-    def find_similar_memory(self, text: str) -> Optional[Memory]:
+    def _ensure_collection(self) -> None:
+        """Make sure the collection exists. The result is cached for the life of the process."""
+        if self._collection_ready:
+            return
+        if not self._collection_exists():
+            self._create_collection()
+        self._collection_ready = True
+
+    async def _run(self, operation: Callable[[], T]) -> T:
+        """Run a collection operation off the event loop, re-creating the collection once if Qdrant reports it missing."""
+        try:
+            return await asyncio.to_thread(operation)
+        except UnexpectedResponse as e:
+            if e.status_code != 404:
+                raise
+            self._collection_ready = False
+            await asyncio.to_thread(self._ensure_collection)
+            return await asyncio.to_thread(operation)
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embed a single text, from the cache if possible, otherwise through the shared micro-batching service."""
+        embedding = self.embedding_cache.get(text)
+        if embedding is None:
+            embedding = await self.embedder.embed(text)
+            self.embedding_cache.put(text, embedding)
+        return embedding
+
+    async def embed_many(self, texts: Sequence[str]) -> List[np.ndarray]:
+        """Embed several texts, only encoding the ones missing from the cache."""
+        return list(await asyncio.gather(*(self.embed(text) for text in texts)))
+
+    def _similar_from_hits(self, hits) -> Optional[Memory]:
+        """Return the top hit as a Memory if it clears SIMILARITY_THRESHOLD."""
+        if hits and hits[0].score >= self.SIMILARITY_THRESHOLD:
+            return self._to_memory(hits[0])
+        return None
+
+    async def find_similar_memory(self, text: str, embedding: Optional[np.ndarray] = None) -> Optional[Memory]:
         """Find if a similar memory already exists.
 
         Args:
             text: The text to search for
+            embedding: Precomputed embedding of `text`, to avoid encoding it again
 
         Returns:
             Optional Memory if a similar one is found
         """
-        results = self.search_memories(text, k=1)
-        if results and results[0].score >= self.SIMILARITY_THRESHOLD:
-            return results[0]
-        return None
+        if embedding is None:
+            embedding = await self.embed(text)
+        return self._similar_from_hits(await self._search(embedding, k=1))
 
-    def store_memory(self, text: str, metadata: dict) -> None:
+    async def store_memory(self, text: str, metadata: dict, embedding: Optional[np.ndarray] = None) -> Optional[Memory]:
         """Store a new memory in the vector store or update if similar exists.
 
+        The text is embedded once and the same vector is used for the duplicate check and the upsert. A similar
+        existing memory is updated in place: it keeps its ID and its payload is merged with the new metadata.
+
         Args:
             text: The text content of the memory
             metadata: Additional information about the memory (timestamp, type, etc.)
+            embedding: Precomputed embedding of `text`, to avoid encoding it again
+
+        Returns:
+            The similar memory that was updated, or None if a new memory was created
         """
-        if not self._collection_exists():
-            self._create_collection()
+        if embedding is None:
+            embedding = await self.embed(text)
+        similar_memory = self._similar_from_hits(await self._search(embedding, k=1))
+        await self._upsert([self._to_point(text, metadata, embedding, similar_memory)])
+        return similar_memory
 
-        # Check if similar memory exists
-        similar_memory = self.find_similar_memory(text)
-        if similar_memory and similar_memory.id:
-            metadata["id"] = similar_memory.id  # Keep same ID for update
+    async def store_memories(self, memories: Sequence[Tuple[str, dict]]) -> List[Optional[Memory]]:
+        """Store many memories with one batched encode, one batched similarity search and one upsert.
 
-        embedding = self.model.encode(text)
-        point = PointStruct(
-            id=metadata.get("id", hash(text)),
-            vector=embedding.tolist(),
-            payload={
-                "text": text,
-                **metadata,
-            },
-        )
+        Args:
+            memories: (text, metadata) pairs
 
-        self.client.upsert(
-            collection_name=self.COLLECTION_NAME,
-            points=[point],
-        )
+        Returns:
+            For each input, the similar memory that was updated, or None if a new memory was created
+        """
+        if not memories:
+            return []
 
-    def search_memories(self, query: str, k: int = 5) -> List[Memory]:
+        embeddings = await self.embed_many([text for text, _ in memories])
+        requests = [SearchRequest(vector=embedding.tolist(), limit=1, with_payload=True) for embedding in embeddings]
+        batch_hits = await self._run(lambda: self.client.search_batch(collection_name=self.COLLECTION_NAME, requests=requests))
+
+        similar = [self._similar_from_hits(hits) for hits in batch_hits]
+        points = {}
+        for (text, metadata), embedding, similar_memory in zip(memories, embeddings, similar):
+            point = self._to_point(text, metadata, embedding, similar_memory)
+            points[point.id] = point  # Later entries win when several map to the same memory
+        await self._upsert(list(points.values()))
+        return similar
+
+    async def search_memories(self, query: str, k: int = 5) -> List[Memory]:
         """Search for similar memories in the vector store.
 
         Args:
@@ -130,24 +277,45 @@ class VectorStore:
         Returns:
             List of Memory objects
         """
-        if not self._collection_exists():
-            return []
+        return [self._to_memory(hit) for hit in await self._search(await self.embed(query), k=k)]
 
-        query_embedding = self.model.encode(query)
-        results = self.client.search(
-            collection_name=self.COLLECTION_NAME,
-            query_vector=query_embedding.tolist(),
-            limit=k,
+    async def _search(self, embedding: np.ndarray, k: int):
+        return await self._run(
+            lambda: self.client.search(
+                collection_name=self.COLLECTION_NAME,
+                query_vector=embedding.tolist(),
+                limit=k,
+            )
         )
 
-        return [
-            Memory(
-                text=hit.payload["text"],
-                metadata={k: v for k, v in hit.payload.items() if k != "text"},
-                score=hit.score,
+    async def _upsert(self, points: List[PointStruct]) -> None:
+        await self._run(
+            lambda: self.client.upsert(
+                collection_name=self.COLLECTION_NAME,
+                points=points,
             )
-            for hit in results
-        ]
+        )
+
+    @staticmethod
+    def _to_point(text: str, metadata: dict, embedding: np.ndarray, similar_memory: Optional[Memory]) -> PointStruct:
+        if similar_memory and similar_memory.id:
+            metadata = {**similar_memory.metadata, **metadata, "id": similar_memory.id}  # Keep same ID for update
+        return PointStruct(
+            id=metadata.get("id", hash(text)),
+            vector=embedding.tolist(),
+            payload={
+                "text": text,
+                **metadata,
+            },
+        )
+
+    @staticmethod
+    def _to_memory(hit) -> Memory:
+        return Memory(
+            text=hit.payload["text"],
+            metadata={k: v for k, v in hit.payload.items() if k != "text"},
+            score=hit.score,
+        )
 
 
 @lru_cache
@@ -1,4 +1,5 @@
 from .speech_to_text import SpeechToText
 from .text_to_speech import TextToSpeech
+from .transcription_cache import TranscriptionCache, get_transcription_cache
 
-__all__ = ["SpeechToText", "TextToSpeech"]
\ No newline at end of file
+__all__ = ["SpeechToText", "TextToSpeech", "TranscriptionCache", "get_transcription_cache"]
\ No newline at end of file
@@ -1,9 +1,8 @@
-import os
-import tempfile
+import asyncio
 from typing import Optional
 
 from settings import settings
-from groq import Groq
+from groq import AsyncGroq
 
 
 class SpeechToText:
@@ -12,22 +11,32 @@ class SpeechToText:
     # Required environment variables
     REQUIRED_ENV_VARS = ["GROQ_API_KEY"]
 
+    # Shared across instances so the limit applies to the whole process
+    _semaphore: Optional[asyncio.Semaphore] = None
+
     def __init__(self):
         """Initialize the SpeechToText class and validate environment variables."""
         self._validate_env_vars()
-        self._client: Optional[Groq] = None
+        self._client: Optional[AsyncGroq] = None
 
     def _validate_env_vars(self) -> None:
         if not settings.GROQ_API_KEY:
             raise ValueError("Missing required environment variable: GROQ_API_KEY")
 
     @property
-    def client(self) -> Groq:
+    def client(self) -> AsyncGroq:
         """Get or create Groq client instance using singleton pattern."""
         if self._client is None:
-            self._client = Groq(api_key=settings.GROQ_API_KEY)
+            self._client = AsyncGroq(api_key=settings.GROQ_API_KEY)
         return self._client
 
+    @classmethod
+    def semaphore(cls) -> asyncio.Semaphore:
+        """Limit the number of transcriptions in flight at once."""
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(settings.STT_MAX_CONCURRENCY)
+        return cls._semaphore
+
     async def transcribe(self, audio_data: bytes) -> str:
         """Convert speech to text using Groq's Whisper model.
 
@@ -45,29 +54,19 @@ class SpeechToText:
             raise ValueError("Audio data cannot be empty")
 
         try:
-            # Create a temporary file with .wav extension
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_file.write(audio_data)
-                temp_file_path = temp_file.name
-
-            try:
-                # Open the temporary file for the API request
-                with open(temp_file_path, "rb") as audio_file:
-                    transcription = self.client.audio.transcriptions.create(
-                        file=audio_file,
-                        model="whisper-large-v3-turbo",
-                        language="en",
-                        response_format="text",
-                    )
-
-                if not transcription:
-                    raise ValueError("Transcription result is empty")
-
-                return transcription
-
-            finally:
-                # Clean up the temporary file
-                os.unlink(temp_file_path)
+            async with self.semaphore():
+                transcription = await self.client.audio.transcriptions.create(
+                    file=("audio.wav", audio_data),
+                    model=settings.STT_MODEL_NAME,
+                    language="en",
+                    response_format="text",
+                    timeout=settings.STT_TIMEOUT,
+                )
+
+            if not transcription:
+                raise ValueError("Transcription result is empty")
+
+            return transcription
 
         except Exception as e:
-            raise ValueError(f"Speech-to-text conversion failed: {str(e)}") from e
\ No newline at end of file
+            raise ValueError(f"Speech-to-text conversion failed: {str(e)}") from e
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence
+
+import aiosqlite
+
+from modules.storage import configure_connection
+from settings import settings
+
+
+class TranscriptionCache:
+    """Persistent cache of Whisper transcriptions, keyed by the SHA-256 of the audio and the model name.
+
+    Besides the content hash, a transcription can be found through aliases such as the WhatsApp media ID or the
+    hash WhatsApp sends in the webhook, so a repeated or forwarded voice note skips the download as well as the STT
+    call. The cache holds at most `max_entries` transcriptions and evicts the least recently used ones.
+    """
+
+    def __init__(self, db_path: str, model: str, max_entries: int = 5000):
+        self.db_path = db_path
+        self.model = model
+        self.max_entries = max_entries
+        self.logger = logging.getLogger(__name__)
+
+        self._db: Optional[aiosqlite.Connection] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+
+        self._alias_hits = 0
+        self._content_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    async def start(self) -> None:
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._db is not None:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            db = await aiosqlite.connect(self.db_path)
+            await configure_connection(db)
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS transcriptions (
+                    content_key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+                """
+            )
+            await db.execute("CREATE INDEX IF NOT EXISTS transcriptions_last_used ON transcriptions (last_used_at)")
+            await db.execute(
+                "CREATE TABLE IF NOT EXISTS transcription_aliases (alias TEXT PRIMARY KEY, content_key TEXT NOT NULL)"
+            )
+            await db.commit()
+            self._db = db
+
+    async def stop(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    def content_key(self, audio_data: bytes) -> str:
+        """Cache key for a clip: the model name and the SHA-256 of the audio bytes."""
+        return f"{self.model}:{hashlib.sha256(audio_data).hexdigest()}"
+
+    def _alias(self, alias: str) -> str:
+        # Aliases are per model, like content keys
+        return f"{self.model}:{alias}"
+
+    async def _touch(self, content_key: str) -> Optional[str]:
+        async with self._db.execute("SELECT text FROM transcriptions WHERE content_key = ?", (content_key,)) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        await self._db.execute(
+            "UPDATE transcriptions SET last_used_at = ? WHERE content_key = ?", (time.time(), content_key)
+        )
+        await self._db.commit()
+        return row[0]
+
+    async def get_by_alias(self, aliases: Sequence[str]) -> Optional[str]:
+        """Transcription stored under any of the aliases, without needing the audio."""
+        await self.start()
+        for alias in aliases:
+            async with self._db.execute(
+                "SELECT content_key FROM transcription_aliases WHERE alias = ?", (self._alias(alias),)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is not None:
+                text = await self._touch(row[0])
+                if text is not None:
+                    self._alias_hits += 1
+                    return text
+        return None
+
+    async def get(self, content_key: str) -> Optional[str]:
+        """Transcription of the audio with this content key. Counts a miss if there is none."""
+        await self.start()
+        text = await self._touch(content_key)
+        if text is None:
+            self._misses += 1
+        else:
+            self._content_hits += 1
+        return text
+
+    async def put(self, content_key: str, text: str, aliases: Sequence[str] = ()) -> None:
+        """Store a transcription, link the aliases to it and evict the least recently used entries over the limit."""
+        await self.start()
+        await self._db.execute(
+            "INSERT OR REPLACE INTO transcriptions (content_key, text, last_used_at) VALUES (?, ?, ?)",
+            (content_key, text, time.time()),
+        )
+        await self.link(content_key, aliases, commit=False)
+        cursor = await self._db.execute(
+            """
+            DELETE FROM transcriptions WHERE content_key IN (
+                SELECT content_key FROM transcriptions ORDER BY last_used_at
+                LIMIT MAX((SELECT COUNT(*) FROM transcriptions) - ?, 0)
+            )
+            """,
+            (self.max_entries,),
+        )
+        if cursor.rowcount > 0:
+            self._evictions += cursor.rowcount
+            await self._db.execute(
+                "DELETE FROM transcription_aliases WHERE content_key NOT IN (SELECT content_key FROM transcriptions)"
+            )
+        await self._db.commit()
+
+    async def link(self, content_key: str, aliases: Sequence[str], commit: bool = True) -> None:
+        """Make an existing transcription reachable through more aliases."""
+        await self.start()
+        await self._db.executemany(
+            "INSERT OR REPLACE INTO transcription_aliases (alias, content_key) VALUES (?, ?)",
+            [(self._alias(alias), content_key) for alias in aliases],
+        )
+        if commit:
+            await self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hits by lookup kind, misses and evictions."""
+        hits = self._alias_hits + self._content_hits
+        lookups = hits + self._misses
+        return {
+            "alias_hits": self._alias_hits,
+            "content_hits": self._content_hits,
+            "misses": self._misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "evictions": self._evictions,
+            "max_entries": self.max_entries,
+        }
+
+
+@lru_cache
+def get_transcription_cache() -> TranscriptionCache:
+    """Get or create the TranscriptionCache singleton instance."""
+    return TranscriptionCache(
+        db_path=settings.TRANSCRIPTION_CACHE_DB_PATH,
+        model=settings.STT_MODEL_NAME,
+        max_entries=settings.TRANSCRIPTION_CACHE_MAX_ENTRIES,
+    )
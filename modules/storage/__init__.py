@@ -0,0 +1,6 @@
+from .blob_store import BlobStore, get_blob_store
+from .checkpoint_retention import CheckpointRetention
+from .process_lock import ProcessLock
+from .sqlite import SQLITE_PRAGMAS, configure_connection
+
+__all__ = ["BlobStore", "CheckpointRetention", "ProcessLock", "SQLITE_PRAGMAS", "configure_connection", "get_blob_store"]
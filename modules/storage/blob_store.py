@@ -0,0 +1,102 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Collection, Tuple
+
+from settings import settings
+
+# Absolute path to the project root, so relative settings paths do not depend on the working directory
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+
+class BlobStore:
+    """Content-addressed local store for generated media.
+
+    Blobs are stored once under `<root>/<first two hex chars>/<sha256>.<ext>` and referred to by the
+    `<sha256>.<ext>` reference, which is what goes into the graph state instead of the bytes themselves.
+    Identical media (a repeated TTS phrase, the same image) is therefore stored only once. Storing a blob again
+    refreshes its modification time, which is what `purge` ages blobs by.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root) if os.path.isabs(root) else _PROJECT_ROOT / root
+
+    def path(self, ref: str) -> str:
+        """Absolute file path of a blob reference."""
+        return str(self.root / ref[:2] / ref)
+
+    def exists(self, ref: str) -> bool:
+        return os.path.exists(self.path(ref))
+
+    def put(self, data: bytes, extension: str) -> str:
+        """Store bytes and return their reference. Writing is atomic and skipped if the blob already exists."""
+        ref = f"{hashlib.sha256(data).hexdigest()}.{extension.lstrip('.')}"
+        path = self.path(ref)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return ref
+
+    def put_file(self, file_path: str) -> str:
+        """Move an existing file into the store and return its reference."""
+        with open(file_path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        ref = f"{digest}{os.path.splitext(file_path)[1]}"
+        path = self.path(ref)
+        if os.path.exists(path):
+            os.unlink(file_path)
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.move(file_path, path)
+        return ref
+
+    def get(self, ref: str) -> bytes:
+        with open(self.path(ref), "rb") as f:
+            return f.read()
+
+    def delete(self, ref: str) -> bool:
+        """Remove a blob. Returns False if it did not exist."""
+        try:
+            os.unlink(self.path(ref))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def purge(self, ttl: float, keep: Collection[str] = ()) -> Tuple[int, int]:
+        """Remove blobs (and interrupted writes) not stored or refreshed for `ttl` seconds, except those in `keep`.
+
+        Returns:
+            The number of files removed and the bytes freed.
+        """
+        if not self.root.is_dir():
+            return 0, 0
+        cutoff = time.time() - ttl
+        removed, freed = 0, 0
+        for path in self.root.glob("*/*"):
+            if path.name in keep:
+                continue
+            try:
+                stat = path.stat()
+                if stat.st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+                    freed += stat.st_size
+            except FileNotFoundError:
+                continue
+        return removed, freed
+
+
+@lru_cache
+def get_blob_store() -> BlobStore:
+    """Get or create the BlobStore singleton instance."""
+    return BlobStore(settings.MEDIA_BLOB_DIR)
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+
+class CheckpointRetention:
+    """Bounds the size of the LangGraph checkpoint database.
+
+    Every graph step writes a checkpoint, so without retention the database only ever grows. A background task
+    periodically keeps the latest `keep_last` checkpoints of every thread, deletes threads that have been idle for
+    longer than `thread_ttl` seconds, and returns the freed pages to the file system with incremental VACUUM.
+    Databases created before incremental auto-vacuum was enabled keep their freed pages for reuse until they are
+    converted offline with scripts/compact_checkpoints.py.
+
+    All statements share the checkpointer's connection and lock, and the work is split into one short step per
+    thread (and per `vacuum_pages` pages), so graph writes are never held up for longer than one step.
+    """
+
+    TOP_THREADS = 10  # Number of largest threads reported in stats
+
+    def __init__(
+        self,
+        saver: AsyncSqliteSaver,
+        db_path: str,
+        keep_last: int = 10,
+        thread_ttl: float = 30 * 24 * 3600,
+        interval: float = 3600.0,
+        vacuum_pages: int = 256,
+    ):
+        if keep_last < 1:
+            raise ValueError("keep_last must be at least 1: the latest checkpoint holds the thread's state")
+        self.saver = saver
+        self.db_path = db_path
+        self.keep_last = keep_last
+        self.thread_ttl = thread_ttl
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+        self.logger = logging.getLogger(__name__)
+
+        self._incremental = False
+        self._task: Optional[asyncio.Task] = None
+        self._runs = 0
+        self._last_run: Dict[str, Any] = {}
+
+    async def _execute(self, sql: str, parameters: tuple = ()) -> List[tuple]:
+        """Run one statement and commit, holding the checkpointer lock only for that statement."""
+        async with self.saver.lock:
+            async with self.saver.conn.execute(sql, parameters) as cursor:
+                rows = await cursor.fetchall()
+            await self.saver.conn.commit()
+        return rows
+
+    async def start(self) -> None:
+        """Prepare the database for retention and start the background task."""
+        async with self.saver.lock:
+            conn = self.saver.conn
+            # Last write per thread, maintained by SQLite itself so every writer (graph runs, the summarizer)
+            # is covered without touching their code
+            await conn.execute(
+                "CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)"
+            )
+            await conn.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS checkpoints_thread_activity AFTER INSERT ON checkpoints
+                BEGIN
+                    INSERT OR REPLACE INTO thread_activity (thread_id, last_seen)
+                    VALUES (NEW.thread_id, CAST(strftime('%s', 'now') AS REAL));
+                END
+                """
+            )
+            # Threads written before the trigger existed start their TTL now
+            await conn.execute(
+                "INSERT OR IGNORE INTO thread_activity (thread_id, last_seen) SELECT DISTINCT thread_id, ? FROM checkpoints",
+                (time.time(),),
+            )
+            await conn.commit()
+
+            async with conn.execute("PRAGMA auto_vacuum") as cursor:
+                (auto_vacuum,) = await cursor.fetchone()
+        self._incremental = auto_vacuum == 2
+        if not self._incremental:
+            # Converting takes a full VACUUM, which would block every graph write (and copy the whole database
+            # into memory, with temp_store=MEMORY) for as long as it runs, so it is never done here
+            self.logger.warning(
+                f"[checkpoint_retention] {self.db_path} is not in incremental auto-vacuum mode; pruned pages are "
+                f"reused but the file will not shrink. Stop the app and run scripts/compact_checkpoints.py to convert it"
+            )
+
+        self._task = asyncio.create_task(self._run_forever())
+        self.logger.info(
+            f"[checkpoint_retention] Keeping {self.keep_last} checkpoint(s) per thread, "
+            f"idle threads expire after {self.thread_ttl / 3600:.0f}h"
+        )
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"[checkpoint_retention] Run failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> Dict[str, Any]:
+        """Expire idle threads, prune old checkpoints and vacuum the freed pages."""
+        started = time.monotonic()
+        size_before = self._file_size()
+
+        expired = await self._expire_idle_threads()
+        pruned = await self._prune_checkpoints()
+        vacuumed_pages = await self._incremental_vacuum()
+
+        self._runs += 1
+        self._last_run = {
+            "expired_threads": expired,
+            "pruned_checkpoints": pruned,
+            "vacuumed_pages": vacuumed_pages,
+            "reclaimed_bytes": max(size_before - self._file_size(), 0),
+            "duration_seconds": round(time.monotonic() - started, 3),
+            "finished_at": time.time(),
+        }
+        self.logger.info(f"[checkpoint_retention] {self._last_run}")
+        return self._last_run
+
+    async def _expire_idle_threads(self) -> int:
+        cutoff = time.time() - self.thread_ttl
+        rows = await self._execute("SELECT thread_id FROM thread_activity WHERE last_seen < ?", (cutoff,))
+        for (thread_id,) in rows:
+            async with self.saver.lock:
+                conn = self.saver.conn
+                # Re-check under the lock in case the thread became active again
+                async with conn.execute(
+                    "SELECT 1 FROM thread_activity WHERE thread_id = ? AND last_seen < ?", (thread_id, cutoff)
+                ) as cursor:
+                    if await cursor.fetchone() is None:
+                        continue
+                await conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+                await conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                await conn.execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+                await conn.commit()
+        return len(rows)
+
+    async def _prune_checkpoints(self) -> int:
+        # Checkpoint IDs are time-ordered (UUIDv6), so the highest IDs are the most recent checkpoints
+        rows = await self._execute(
+            "SELECT thread_id, checkpoint_ns FROM checkpoints GROUP BY thread_id, checkpoint_ns HAVING COUNT(*) > ?",
+            (self.keep_last,),
+        )
+        pruned = 0
+        for thread_id, checkpoint_ns in rows:
+            async with self.saver.lock:
+                conn = self.saver.conn
+                cursor = await conn.execute(
+                    """
+                    DELETE FROM checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (
+                        SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                        ORDER BY checkpoint_id DESC LIMIT ?
+                    )
+                    """,
+                    (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep_last),
+                )
+                pruned += cursor.rowcount
+                await conn.execute(
+                    """
+                    DELETE FROM writes
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (
+                        SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                    )
+                    """,
+                    (thread_id, checkpoint_ns, thread_id, checkpoint_ns),
+                )
+                await conn.commit()
+        return pruned
+
+    async def _incremental_vacuum(self) -> int:
+        if not self._incremental:
+            return 0
+        vacuumed = 0
+        while True:
+            (free_pages,) = (await self._execute("PRAGMA freelist_count"))[0]
+            if not free_pages:
+                return vacuumed
+            await self._execute(f"PRAGMA incremental_vacuum({min(free_pages, self.vacuum_pages)})")
+            vacuumed += min(free_pages, self.vacuum_pages)
+            # Give queued graph writes a chance to take the lock between steps
+            await asyncio.sleep(0)
+
+    def _file_size(self) -> int:
+        return sum(os.path.getsize(p) for p in (self.db_path, f"{self.db_path}-wal") if os.path.exists(p))
+
+    async def stats(self) -> Dict[str, Any]:
+        """Total storage, the largest threads and the outcome of the last retention run."""
+        (page_count,) = (await self._execute("PRAGMA page_count"))[0]
+        (page_size,) = (await self._execute("PRAGMA page_size"))[0]
+        (free_pages,) = (await self._execute("PRAGMA freelist_count"))[0]
+        (threads, checkpoints) = (
+            await self._execute("SELECT COUNT(DISTINCT thread_id), COUNT(*) FROM checkpoints")
+        )[0]
+        largest = await self._execute(
+            """
+            SELECT c.thread_id, c.checkpoints, c.bytes + COALESCE(w.bytes, 0), a.last_seen
+            FROM (
+                SELECT thread_id, COUNT(*) AS checkpoints, SUM(LENGTH(checkpoint) + LENGTH(metadata)) AS bytes
+                FROM checkpoints GROUP BY thread_id
+            ) AS c
+            LEFT JOIN (SELECT thread_id, SUM(LENGTH(value)) AS bytes FROM writes GROUP BY thread_id) AS w
+                ON w.thread_id = c.thread_id
+            LEFT JOIN thread_activity AS a ON a.thread_id = c.thread_id
+            ORDER BY 3 DESC LIMIT ?
+            """,
+            (self.TOP_THREADS,),
+        )
+        return {
+            "file_bytes": self._file_size(),
+            "used_bytes": (page_count - free_pages) * page_size,
+            "free_bytes": free_pages * page_size,
+            "incremental_vacuum": self._incremental,
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "keep_last": self.keep_last,
+            "thread_ttl_seconds": self.thread_ttl,
+            "largest_threads": [
+                {"thread_id": thread_id, "checkpoints": count, "bytes": size, "last_seen": last_seen}
+                for thread_id, count, size, last_seen in largest
+            ],
+            "runs": self._runs,
+            "last_run": self._last_run,
+        }
@@ -0,0 +1,56 @@
+import logging
+import os
+from typing import IO, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class ProcessLock:
+    """Exclusive lock on a file, held for the life of the process that owns the data directory.
+
+    The job, send and memory queues recover every unfinished row on start and keep per-user ordering in memory, so
+    only one process may run them against a data directory at a time. The OS drops the lock when the process exits,
+    so a crash never leaves it stale.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._file: Optional[IO] = None
+
+    def acquire(self) -> None:
+        """Take the lock without waiting.
+
+        Raises:
+            RuntimeError: If another process already holds it.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lock_file = open(self.path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(
+                f"{self.path} is locked by another process. The app keeps its queues in memory and must run as a "
+                f"single process per data directory (do not start uvicorn with --workers > 1)"
+            )
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._file = lock_file
+        self.logger.info(f"[process_lock] Acquired {self.path} (pid {os.getpid()})")
+
+    def release(self) -> None:
+        if self._file is not None:
+            # Closing the file releases the lock on every platform
+            self._file.close()
+            self._file = None
@@ -0,0 +1,19 @@
+import aiosqlite
+
+# Pragmas applied to every long-lived SQLite connection. WAL lets readers and the single writer proceed
+# concurrently, and NORMAL sync is durable across application crashes (only an OS crash can lose the last commit).
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -16000,  # 16 MB page cache
+    "temp_store": "MEMORY",
+    "mmap_size": 134217728,  # 128 MB
+}
+
+
+async def configure_connection(conn: aiosqlite.Connection) -> None:
+    """Apply SQLITE_PRAGMAS to an open connection."""
+    for name, value in SQLITE_PRAGMAS.items():
+        await conn.execute(f"PRAGMA {name}={value}")
+    await conn.commit()
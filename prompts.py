@@ -1,3 +1,14 @@
+# Labelled routing examples, shared by the LLM router prompt and the local intent classifier
+ROUTER_EXAMPLES = [
+    ("Generate an image of a dog on Mars", "image"),
+    ("Create a picture of a sunset", "image"),
+    ("Show me what a cat looks like", "image"),
+    ("Say hello out loud", "audio"),
+    ("Read that back to me", "audio"),
+    ("Hi how are you", "conversation"),
+    ("What is the capital of France", "conversation"),
+]
+
 ROUTER_PROMPT = """You are a routing assistant. Analyze the user's LAST message and decide the response type.
 
 Output MUST be exactly one of:
@@ -6,13 +17,7 @@ Output MUST be exactly one of:
 - 'conversation' → everything else (normal text reply)
 
 EXAMPLES:
-"Generate an image of a dog on Mars" → image
-"Create a picture of a sunset" → image
-"Show me what a cat looks like" → image
-"Say hello out loud" → audio
-"Read that back to me" → audio
-"Hi how are you" → conversation
-"What is the capital of France" → conversation
+""" + "\n".join(f'"{text}" → {label}' for text, label in ROUTER_EXAMPLES) + """
 
 Only look at the intent of the LAST user message to decide."""
 
@@ -0,0 +1,56 @@
+"""Allocation and latency of getting the reply chain per node call, rebuilt vs cached.
+
+"rebuilt" constructs a new ChatGroq and prompt pipeline on every call (the old behaviour); "cached" goes
+through the registry in graph/utils. No LLM requests are made.
+
+Usage:
+    python scripts/bench_chains.py [--calls 500]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_groq import ChatGroq
+
+from graph.utils.chains import get_conversation_chain
+from graph.utils.helpers import AsteriskRemovalParser
+from prompts import CONVERSATION_PROMPT
+from settings import settings
+
+
+def rebuilt_chain(summary: str):
+    model = ChatGroq(api_key=settings.GROQ_API_KEY, model_name=settings.TEXT_MODEL_NAME, temperature=0.7)
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", CONVERSATION_PROMPT + f"\n\nSummary of conversation so far: {summary}"),
+            MessagesPlaceholder(variable_name="messages"),
+        ]
+    )
+    return prompt | model | AsteriskRemovalParser()
+
+
+def measure(label: str, build, calls: int) -> None:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for i in range(calls):
+        build(f"summary {i}")
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<8} {elapsed / calls * 1e6:9.1f} us/call   peak {peak / 1024:9.1f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=500)
+    calls = parser.parse_args().calls
+
+    get_conversation_chain()  # build once so only lookups are measured
+    measure("rebuilt", rebuilt_chain, calls)
+    measure("cached", lambda summary: get_conversation_chain(), calls)
@@ -0,0 +1,79 @@
+"""Compare per-message checkpointer setup against a long-lived checkpointer and compiled graph.
+
+Runs a no-op graph over the same message schema as the agent so only the SQLite/compile overhead is measured.
+
+Usage:
+    python scripts/bench_checkpointer.py [--messages 200]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph import END, START, StateGraph
+
+from graph.state import AICompanionState
+from modules.storage import configure_connection
+
+
+def build_graph() -> StateGraph:
+    builder = StateGraph(AICompanionState)
+    builder.add_node("reply", lambda state: {"messages": AIMessage(content="ok")})
+    builder.add_edge(START, "reply")
+    builder.add_edge("reply", END)
+    return builder
+
+
+def summarize(label: str, samples: list) -> None:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<12} mean {statistics.mean(samples) * 1000:7.2f} ms   p95 {p95 * 1000:7.2f} ms")
+
+
+async def per_message(db_path: str, n: int) -> list:
+    builder = build_graph()
+    samples = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        async with AsyncSqliteSaver.from_conn_string(db_path) as checkpointer:
+            graph = builder.compile(checkpointer=checkpointer)
+            config = {"configurable": {"thread_id": f"user-{i % 10}"}}
+            await graph.ainvoke({"messages": [HumanMessage(content="hi")]}, config)
+            await graph.aget_state(config)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+async def long_lived(db_path: str, n: int) -> list:
+    samples = []
+    async with AsyncSqliteSaver.from_conn_string(db_path) as checkpointer:
+        await configure_connection(checkpointer.conn)
+        await checkpointer.setup()
+        graph = build_graph().compile(checkpointer=checkpointer)
+        for i in range(n):
+            t0 = time.perf_counter()
+            config = {"configurable": {"thread_id": f"user-{i % 10}"}}
+            await graph.ainvoke({"messages": [HumanMessage(content="hi")]}, config)
+            await graph.aget_state(config)
+            samples.append(time.perf_counter() - t0)
+    return samples
+
+
+async def main(n: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        summarize("per-message", await per_message(os.path.join(tmp, "before.db"), n))
+        summarize("long-lived", await long_lived(os.path.join(tmp, "after.db"), n))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    asyncio.run(main(parser.parse_args().messages))
@@ -0,0 +1,74 @@
+"""Measure the webhook dedup store under concurrent duplicate deliveries.
+
+Every message ID is delivered `--deliveries` times, in random order, with `--concurrency` claims in flight at
+once against one store, the way Meta's duplicate deliveries race through the app's single process. Reports claim
+throughput and latency, and checks that each ID was claimed exactly once.
+
+The app runs as one process per data directory, so the store is not shared between processes.
+
+Usage:
+    python scripts/bench_dedup.py [--deliveries 4] [--concurrency 16] [--messages 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from whatsapp.dedup_store import DedupStore
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def main(deliveries: int, concurrency: int, messages: int) -> None:
+    message_ids = [f"wamid.bench.{i}" for i in range(messages)] * deliveries
+    random.Random(0).shuffle(message_ids)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = DedupStore(os.path.join(tmp, "dedup.db"))
+        await store.start()
+        claimed, latencies = [], []
+        pending = iter(message_ids)
+
+        async def client() -> None:
+            for message_id in pending:
+                t0 = time.perf_counter()
+                [is_new] = await store.claim([message_id])
+                latencies.append(time.perf_counter() - t0)
+                if is_new:
+                    claimed.append(message_id)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        await store.stop()
+
+    claims = Counter(claimed)
+    total = len(latencies)
+    print(f"deliveries x concurrency: {deliveries} x {concurrency}")
+    print(f"claims:                   {total} ({messages} distinct IDs, {total - messages} duplicates)")
+    print(f"throughput:               {total / elapsed:,.0f} claims/s")
+    print(f"latency p50:              {percentile(latencies, 0.5) * 1000:.3f} ms")
+    print(f"latency p95:              {percentile(latencies, 0.95) * 1000:.3f} ms")
+    print(f"latency p99:              {percentile(latencies, 0.99) * 1000:.3f} ms")
+    print(f"claimed exactly once:     {sum(1 for count in claims.values() if count == 1)} / {messages}")
+    print(f"claimed more than once:   {sum(1 for count in claims.values() if count > 1)}")
+    print(f"never claimed:            {messages - len(claims)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--deliveries", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.deliveries, args.concurrency, args.messages))
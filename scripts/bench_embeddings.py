@@ -0,0 +1,52 @@
+"""Embedding throughput of the micro-batching service across batch sizes.
+
+Fires N concurrent `embed` calls (as many conversations would) and reports texts/second for each batch size.
+Batch size 1 is equivalent to the old one-encode-per-text behaviour.
+
+Usage:
+    python scripts/bench_embeddings.py [--requests 512] [--batch-sizes 1 8 32 64] [--max-wait-ms 5]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sentence_transformers import SentenceTransformer
+
+from modules.memory.embedding_service import EmbeddingService
+from modules.memory.vector_store import VectorStore
+
+
+async def run(model, requests: int, batch_size: int, max_wait_ms: float) -> None:
+    service = EmbeddingService(model, max_batch_size=batch_size, max_wait_ms=max_wait_ms)
+    texts = [f"User {i} mentioned they enjoy hiking and cooking on weekends" for i in range(requests)]
+
+    t0 = time.perf_counter()
+    await service.embed_many(texts)
+    elapsed = time.perf_counter() - t0
+
+    stats = service.stats()
+    print(
+        f"batch_size {batch_size:>4}: {requests / elapsed:8.1f} texts/s "
+        f"({stats['batches']} batches, avg {stats['avg_batch_size']})"
+    )
+
+
+async def main(requests: int, batch_sizes: list, max_wait_ms: float) -> None:
+    model = SentenceTransformer(VectorStore.EMBEDDING_MODEL)
+    model.encode("warm up")
+    for batch_size in batch_sizes:
+        await run(model, requests, batch_size, max_wait_ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.batch_sizes, args.max_wait_ms))
@@ -0,0 +1,57 @@
+"""Measure event-loop responsiveness while transcriptions are in flight.
+
+A ticker task sleeps for 10 ms in a loop and records how late it wakes up. With a blocking client the lag grows
+with every concurrent transcription; with the async client it should stay close to zero.
+
+Usage:
+    python scripts/bench_event_loop.py path/to/sample.ogg [--concurrency 8]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.speech import SpeechToText
+
+TICK = 0.01
+
+
+async def ticker(lags: list, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - t0 - TICK)
+
+
+async def main(audio_path: str, concurrency: int) -> None:
+    with open(audio_path, "rb") as f:
+        audio_data = f.read()
+
+    stt = SpeechToText()
+    lags: list = []
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lags, stop))
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(stt.transcribe(audio_data) for _ in range(concurrency)), return_exceptions=True)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await tick_task
+
+    failures = sum(isinstance(r, Exception) for r in results)
+    lags.sort()
+    print(f"transcriptions: {concurrency} ({failures} failed) in {elapsed:.2f}s")
+    print(f"loop lag: mean {statistics.mean(lags) * 1000:.2f} ms, max {lags[-1] * 1000:.2f} ms over {len(lags)} ticks")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("audio_path")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.audio_path, args.concurrency))
@@ -0,0 +1,125 @@
+"""Compare vision payloads before and after image preprocessing.
+
+For each sample image, reports the raw and prepared payload size (as the base64 data URL actually sent), the
+prepared resolution and the time spent preprocessing. With --call, also sends both versions to the vision model
+and reports the end-to-end latency of each.
+
+Without --images, a set of synthetic samples is generated: a 12 MP camera JPEG, a large PNG screenshot, a
+transparent sticker and a phone-sized WEBP.
+
+Usage:
+    python scripts/bench_vision_preprocess.py [--images path/to/dir] [--call] [--repeats 3]
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from modules.image import ImageToText
+from modules.image.preprocess import prepare_image
+from settings import settings
+
+PROMPT = "Please describe what you see in this image in the context of our conversation."
+
+
+def synthetic_image(width: int, height: int, mode: str = "RGB") -> Image.Image:
+    # Noise over a gradient compresses about as badly as a real photo
+    channels = [
+        Image.blend(Image.linear_gradient("L").resize((width, height)), Image.effect_noise((width, height), 40), 0.5)
+        for _ in range(3)
+    ]
+    image = Image.merge("RGB", channels)
+    if mode == "RGBA":
+        mask = Image.new("L", (width, height), 0)
+        mask.paste(255, (width // 8, height // 8, width * 7 // 8, height * 7 // 8))
+        image.putalpha(mask)
+    return image
+
+
+def encode(image: Image.Image, image_format: str, **params) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **params)
+    return buffer.getvalue()
+
+
+def synthetic_samples() -> dict:
+    return {
+        "camera_12mp.jpg": encode(synthetic_image(4032, 3024), "JPEG", quality=95),
+        "screenshot.png": encode(synthetic_image(2048, 2048), "PNG"),
+        "sticker.png": encode(synthetic_image(512, 512, "RGBA"), "PNG"),
+        "phone.webp": encode(synthetic_image(1080, 1920), "WEBP", quality=90),
+    }
+
+
+def load_samples(directory: str) -> dict:
+    samples = {}
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), "rb") as f:
+            samples[name] = f.read()
+    return samples
+
+
+async def vision_latency(image_to_text: ImageToText, payload: bytes, mime_type: str, repeats: int) -> float:
+    url = f"data:{mime_type};base64,{base64.b64encode(payload).decode('utf-8')}"
+    messages = [{"role": "user", "content": [{"type": "text", "text": PROMPT}, {"type": "image_url", "image_url": {"url": url}}]}]
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        try:
+            await image_to_text.client.chat.completions.create(
+                model=settings.ITT_MODEL_NAME, messages=messages, max_tokens=1000, timeout=settings.ITT_TIMEOUT
+            )
+        except Exception as e:
+            # Raw camera photos can exceed the API's request size limit, which is part of what this measures
+            print(f"  vision call failed ({len(url) / 1e6:.1f} MB payload): {e}")
+            return float("nan")
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+async def main(images: str, call: bool, repeats: int) -> None:
+    samples = load_samples(images) if images else synthetic_samples()
+    image_to_text = ImageToText() if call else None
+
+    header = f"{'image':<22} {'format':<6} {'raw payload':>12} {'prepared':>10} {'size':>11} {'prep ms':>8}"
+    print(header + (f" {'raw s':>7} {'prep s':>7}" if call else ""))
+    for name, data in samples.items():
+        t0 = time.perf_counter()
+        prepared = await asyncio.to_thread(
+            prepare_image,
+            data,
+            max_side=settings.ITT_MAX_IMAGE_SIDE,
+            max_bytes=settings.ITT_MAX_IMAGE_BYTES,
+            quality=settings.ITT_JPEG_QUALITY,
+        )
+        prep_ms = (time.perf_counter() - t0) * 1000
+        raw_payload = len(base64.b64encode(data))
+        prepared_payload = len(base64.b64encode(prepared.data))
+        line = (
+            f"{name:<22} {prepared.original_format:<6} {raw_payload / 1e6:>10.2f}MB {prepared_payload / 1e6:>8.2f}MB "
+            f"{f'{prepared.width}x{prepared.height}':>11} {prep_ms:>8.1f}"
+        )
+        if call:
+            # Raw bytes are labelled image/jpeg, as they were before preprocessing existed
+            raw_latency = await vision_latency(image_to_text, data, "image/jpeg", repeats)
+            prepared_latency = await vision_latency(image_to_text, prepared.data, prepared.mime_type, repeats)
+            line += f" {raw_latency:>7.2f} {prepared_latency + prep_ms / 1000:>7.2f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", help="Directory of sample images (default: generated samples)")
+    parser.add_argument("--call", action="store_true", help="Also measure vision model latency (costs API calls)")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.images, args.call, args.repeats))
@@ -0,0 +1,98 @@
+"""Strip binary media out of existing checkpoints in the short-term memory database.
+
+Older versions stored the generated MP3 bytes (`audio_buffer`) in the graph state, so every checkpoint of an
+audio turn carried a copy. This moves those bytes into the blob store (setting `audio_ref` when the checkpoint has
+none), removes every bytes-valued channel from checkpoints and pending writes, then VACUUMs the database and
+reports its size before and after.
+
+The VACUUM also switches the database to incremental auto-vacuum, which lets the app's checkpoint retention give
+pruned pages back to the file system. The app never runs a full VACUUM itself.
+
+Stop the app before running it.
+
+Usage:
+    python scripts/compact_checkpoints.py [--db data/memory.db] [--dry-run]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from modules.storage import get_blob_store
+from settings import settings
+
+
+def db_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+
+def migrate_bytes(channel: str, value: bytes, blob_store) -> str:
+    return blob_store.put(value, "mp3" if channel == "audio_buffer" else "bin")
+
+
+def compact(db_path: str, dry_run: bool) -> None:
+    serde = JsonPlusSerializer()
+    blob_store = get_blob_store()
+    size_before = db_size(db_path)
+    conn = sqlite3.connect(db_path)
+
+    stripped_checkpoints = 0
+    rows = conn.execute("SELECT thread_id, checkpoint_ns, checkpoint_id, type, checkpoint FROM checkpoints").fetchall()
+    for thread_id, checkpoint_ns, checkpoint_id, type_, blob in rows:
+        checkpoint = serde.loads_typed((type_, blob))
+        values = checkpoint.get("channel_values", {})
+        binary = [key for key, value in values.items() if isinstance(value, (bytes, bytearray))]
+        if not binary:
+            continue
+        stripped_checkpoints += 1
+        if dry_run:
+            continue
+        for key in binary:
+            ref = migrate_bytes(key, bytes(values.pop(key)), blob_store)
+            if key == "audio_buffer":
+                values.setdefault("audio_ref", ref)
+            checkpoint.get("channel_versions", {}).pop(key, None)
+        new_type, new_blob = serde.dumps_typed(checkpoint)
+        conn.execute(
+            "UPDATE checkpoints SET type = ?, checkpoint = ? "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (new_type, new_blob, thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    stripped_writes = 0
+    rows = conn.execute("SELECT rowid, channel, type, value FROM writes").fetchall()
+    for rowid, channel, type_, blob in rows:
+        value = serde.loads_typed((type_, blob))
+        if not isinstance(value, (bytes, bytearray)):
+            continue
+        stripped_writes += 1
+        if not dry_run:
+            migrate_bytes(channel, bytes(value), blob_store)
+            conn.execute("DELETE FROM writes WHERE rowid = ?", (rowid,))
+
+    if not dry_run:
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    conn.close()
+
+    size_after = db_size(db_path)
+    print(f"checkpoints stripped: {stripped_checkpoints}")
+    print(f"writes removed:       {stripped_writes}")
+    print(f"database size:        {size_before / 1e6:.2f} MB -> {size_after / 1e6:.2f} MB")
+    if dry_run:
+        print("(dry run, nothing was changed)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=settings.SHORT_TERM_MEMORY_DB_PATH)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    compact(args.db, args.dry_run)
@@ -0,0 +1,92 @@
+"""Offline evaluation of the two-tier router.
+
+Classifies every labelled message with the local tiers and falls back to the LLM router for the ambiguous ones,
+then reports accuracy, the LLM-call rate and p50/p95 routing latency.
+
+Usage:
+    python scripts/eval_router.py [--dataset scripts/data/router_eval.jsonl] [--no-llm]
+
+With --no-llm the LLM is never called and ambiguous messages count as misses, which makes the run free and
+shows the accuracy of the local tiers on their own.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage
+from sentence_transformers import SentenceTransformer
+
+from graph.utils.chains import get_router_chain
+from graph.utils.intent_classifier import IntentClassifier
+from modules.memory.embedding_service import EmbeddingService
+from modules.memory.vector_store import VectorStore
+from settings import settings
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "router_eval.jsonl")
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def main(dataset: str, use_llm: bool) -> None:
+    with open(dataset) as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+
+    # Standalone embedder so the eval does not need a Qdrant connection
+    embedder = EmbeddingService(SentenceTransformer(VectorStore.EMBEDDING_MODEL))
+    classifier = IntentClassifier(
+        embed=embedder.embed,
+        similarity_threshold=settings.ROUTER_SIMILARITY_THRESHOLD,
+        similarity_margin=settings.ROUTER_SIMILARITY_MARGIN,
+    )
+    await classifier.classify("warm up")  # Embeds the examples outside the timed loop
+    router_chain = get_router_chain() if use_llm else None
+
+    correct, latencies, tiers, misses, decided = 0, [], Counter(), [], []
+    for sample in samples:
+        t0 = time.perf_counter()
+        result = await classifier.classify(sample["text"])
+        workflow, tier = result.workflow, result.tier
+        if workflow is None:
+            tier = "llm"
+            if router_chain is not None:
+                response = await router_chain.ainvoke({"messages": [HumanMessage(content=sample["text"])]})
+                workflow = response.response_type
+        latencies.append(time.perf_counter() - t0)
+        tiers[tier] += 1
+        decided.append((sample["text"], sample["label"], workflow, tier))
+        if workflow == sample["label"]:
+            correct += 1
+        else:
+            misses.append((sample["text"], sample["label"], workflow, tier))
+
+    total = len(samples)
+    print(f"samples:       {total}")
+    print(f"accuracy:      {correct / total:.1%}")
+    print(f"llm call rate: {tiers['llm'] / total:.1%}")
+    print(f"tiers:         {dict(tiers)}")
+    # How often the rule shortcut is right when it fires, since it skips every other tier
+    keyword = [(label, workflow) for text, label, workflow, tier in decided if tier == "keyword"]
+    if keyword:
+        print(f"keyword precision: {sum(label == workflow for label, workflow in keyword) / len(keyword):.1%} ({len(keyword)} fired)")
+    print(f"latency p50:   {percentile(latencies, 0.5) * 1000:.2f} ms")
+    print(f"latency p95:   {percentile(latencies, 0.95) * 1000:.2f} ms")
+    for text, label, workflow, tier in misses:
+        print(f"  miss [{tier}] expected {label}, got {workflow}: {text}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dataset", default=DEFAULT_DATASET)
+    parser.add_argument("--no-llm", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.dataset, not args.no_llm))
@@ -0,0 +1,94 @@
+"""Replay captured webhook deliveries against the webhook endpoint and check what gets dispatched.
+
+Posts every payload in the dataset to POST /whatsapp_response, backed by a real JobQueue whose handler only
+records the messages it receives, then checks that:
+    - every distinct message ID across all deliveries is dispatched exactly once,
+    - each sender's messages are dispatched in the order they were sent,
+    - every delivery (including status-only ones) is answered with a 200.
+
+Exits with status 1 if any check fails.
+
+Usage:
+    python scripts/replay_webhooks.py [--dataset scripts/data/webhook_replay.jsonl]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+
+from whatsapp.dedup_store import DedupStore
+from whatsapp.job_queue import JobQueue
+from whatsapp.whatsapp_response import parse_webhook_events, whatsapp_router
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "webhook_replay.jsonl")
+
+
+async def main(dataset: str) -> bool:
+    with open(dataset) as f:
+        deliveries = [json.loads(line) for line in f if line.strip()]
+
+    dispatched = []
+
+    async def record(jobs):
+        dispatched.extend(job.payload for job in jobs)
+
+    app = FastAPI()
+    app.include_router(whatsapp_router)
+    ok = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.state.job_queue = JobQueue(handler=record, db_path=os.path.join(tmp, "jobs.db"))
+        app.state.dedup_store = DedupStore(os.path.join(tmp, "dedup.db"))
+        await app.state.job_queue.start()
+        await app.state.dedup_store.start()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+            for delivery in deliveries:
+                t0 = time.perf_counter()
+                response = await client.post("/whatsapp_response", json=delivery["payload"])
+                elapsed = (time.perf_counter() - t0) * 1000
+                print(f"{delivery['name']:<40} {response.status_code} {response.text:<25} {elapsed:6.2f} ms")
+                ok &= response.status_code == 200
+
+        while app.state.job_queue.stats()["depth"] or app.state.job_queue.stats()["busy_workers"]:
+            await asyncio.sleep(0.01)
+        await app.state.job_queue.stop()
+        await app.state.dedup_store.stop()
+
+    expected = {}
+    for delivery in deliveries:
+        for message in parse_webhook_events(delivery["payload"])[0]:
+            expected.setdefault(message["id"], message)
+
+    counts = Counter(message["id"] for message in dispatched)
+    missing = set(expected) - set(counts)
+    repeated = {message_id for message_id, count in counts.items() if count > 1}
+
+    by_sender = defaultdict(list)
+    for message in dispatched:
+        by_sender[message["from"]].append(int(message["timestamp"]))
+    out_of_order = [sender for sender, timestamps in by_sender.items() if timestamps != sorted(timestamps)]
+
+    print(f"\ndistinct messages: {len(expected)}")
+    print(f"dispatched:        {len(dispatched)}")
+    print(f"missing:           {sorted(missing) or 'none'}")
+    print(f"dispatched twice:  {sorted(repeated) or 'none'}")
+    print(f"out of order:      {out_of_order or 'none'}")
+    return ok and not missing and not repeated and not out_of_order
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dataset", default=DEFAULT_DATASET)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args.dataset)) else 1)
@@ -18,20 +18,86 @@ class Settings(BaseSettings):
     STT_MODEL_NAME: str = "whisper-large-v3-turbo"
     TTS_MODEL_NAME: str = "eleven_flash_v2_5"
     ITT_MODEL_NAME: str = "meta-llama/llama-4-scout-17b-16e-instruct"
+    GROQ_MAX_CONNECTIONS: int = 20
+
+    STT_TIMEOUT: float = 30.0
+    STT_MAX_CONCURRENCY: int = 4
+    TRANSCRIPTION_CACHE_DB_PATH: str = "data/transcriptions.db"
+    TRANSCRIPTION_CACHE_MAX_ENTRIES: int = 5000
+    ITT_TIMEOUT: float = 30.0
+    ITT_MAX_CONCURRENCY: int = 4
+    ITT_MAX_IMAGE_SIDE: int = 1280
+    ITT_MAX_IMAGE_BYTES: int = 1_000_000
+    ITT_JPEG_QUALITY: int = 85
+    VISION_CACHE_DB_PATH: str = "data/vision_cache.db"
+    VISION_CACHE_HAMMING_TOLERANCE: int = 0  # Out of 64 bits; 0 reuses descriptions of byte-identical images only
+    VISION_CACHE_MAX_ENTRIES: int = 5000
 
     MEMORY_TOP_K: int = 3
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_MAX_WAIT_MS: float = 5.0
+    EMBEDDING_CACHE_SIZE: int = 10000
+    EMBEDDING_CACHE_PATH: Optional[str] = None
+
+    MEMORY_QUEUE_DB_PATH: str = "data/memory_queue.db"
+    MEMORY_EXTRACTION_CONCURRENCY: int = 2
+    MEMORY_EXTRACTION_MAX_RETRIES: int = 5
+    MEMORY_EXTRACTION_RETRY_DELAY: float = 2.0
+    MEMORY_EXTRACTION_MAX_ATTEMPTS: int = 15  # Across restarts; a job failing this often is dropped
+
     ROUTER_MESSAGES_TO_ANALYZE: int = 3
+    ROUTER_LOCAL_TIER: bool = True
+    ROUTER_SIMILARITY_THRESHOLD: float = 0.6
+    ROUTER_SIMILARITY_MARGIN: float = 0.1
     TOTAL_MESSAGES_SUMMARY_TRIGGER: int = 20
     TOTAL_MESSAGES_AFTER_SUMMARY: int = 5
 
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    CONTEXT_SUMMARY_MAX_TOKENS: int = 500
+    CONTEXT_MEMORY_MAX_TOKENS: int = 300
+
     SHORT_TERM_MEMORY_DB_PATH: str = "data/memory.db"
+    CHECKPOINT_KEEP_LAST: int = 10
+    CHECKPOINT_THREAD_TTL_DAYS: float = 30.0
+    CHECKPOINT_RETENTION_INTERVAL: float = 3600.0
+    CHECKPOINT_VACUUM_PAGES: int = 256
+
+    JOB_QUEUE_DB_PATH: str = "data/jobs.db"
+    JOB_QUEUE_WORKERS: int = 4
+    JOB_QUEUE_MAX_SIZE: int = 100
+    JOB_QUEUE_ENQUEUE_TIMEOUT: float = 2.0
+    JOB_QUEUE_SHARDS: int = 16
+    JOB_QUEUE_MAX_PENDING_PER_KEY: int = 20
+    JOB_QUEUE_DEBOUNCE_MS: float = 0.0  # 0 disables coalescing of message bursts
+    JOB_QUEUE_DEBOUNCE_MAX_WAIT_MS: float = 3000.0
+    JOB_QUEUE_FAILED_TTL_DAYS: float = 7.0
+
+    DEDUP_DB_PATH: str = "data/dedup.db"
+    DEDUP_TTL: float = 86400.0
 
-    GENERATED_AUDIO_DIR: str = "generated/audio"
     GENERATED_IMAGE_DIR: str = "generated/image"
+    MEDIA_BLOB_DIR: str = "generated/media"
+    MEDIA_BLOB_TTL_DAYS: float = 7.0  # Blobs no pending reply refers to are deleted after this long
 
     WHATSAPP_TOKEN: Optional[str] = None
     WHATSAPP_PHONE_NUMBER_ID: Optional[str] = None
     WHATSAPP_VERIFY_TOKEN: Optional[str] = None
 
+    GRAPH_API_HTTP2: bool = True
+    GRAPH_API_MAX_CONNECTIONS: int = 20
+    GRAPH_API_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    GRAPH_API_TIMEOUT: float = 30.0
+    GRAPH_API_CONNECT_TIMEOUT: float = 5.0
+
+    SEND_QUEUE_DB_PATH: str = "data/send_queue.db"
+    SEND_CONCURRENCY: int = 8
+    SEND_RATE_PER_SECOND: float = 80.0  # Cloud API default throughput per business phone number
+    SEND_BURST: float = 80.0
+    SEND_MAX_ATTEMPTS: int = 6
+    SEND_RETRY_BASE_DELAY: float = 1.0
+    SEND_RETRY_MAX_DELAY: float = 60.0
+    SEND_FAILED_TTL_DAYS: float = 7.0  # Messages that could not be sent are kept this long for inspection
+    MEDIA_UPLOAD_CACHE_TTL_DAYS: float = 29.0  # WhatsApp keeps uploaded media for 30 days
+
 
 settings = Settings()
\ No newline at end of file
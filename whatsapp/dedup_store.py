@@ -0,0 +1,115 @@
+# Webhook deduplication. Meta delivers the same webhook from several data centers, and a duplicate that gets through
+# costs a full LLM pipeline, so message IDs are claimed in a SQLite table that survives restarts.
+
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+import aiosqlite
+
+from modules.storage import configure_connection
+
+
+class DedupStore:
+    """Claims webhook message IDs with an atomic insert-if-absent on a SQLite table.
+
+    A claim succeeds only for the first caller to present an ID within `ttl` seconds. Each batch of IDs is claimed
+    with a single `INSERT ... ON CONFLICT ... RETURNING` statement, so checking and marking can never interleave with
+    another concurrent claim. Rows older than the TTL count as absent and are purged periodically.
+
+    The store serves the app's single process (see ProcessLock); it is not shared between uvicorn workers or
+    replicas, which would each need their own data directory.
+    """
+
+    BATCH_SIZE = 500  # IDs per statement, well under SQLite's bound-parameter limit
+    LATENCY_SAMPLES = 1000
+
+    def __init__(self, db_path: str, ttl: float = 24 * 3600, purge_interval: float = 300.0):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.logger = logging.getLogger(__name__)
+
+        self._db: Optional[aiosqlite.Connection] = None
+        self._last_purge = 0.0
+
+        self._claimed = 0
+        self._duplicates = 0
+        self._latencies: Deque[float] = deque(maxlen=self.LATENCY_SAMPLES)
+
+    async def start(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._db = await aiosqlite.connect(self.db_path)
+        await configure_connection(self._db)
+        await self._db.execute(
+            "CREATE TABLE IF NOT EXISTS seen_messages (id TEXT PRIMARY KEY, seen_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        await self._db.execute("CREATE INDEX IF NOT EXISTS seen_messages_seen_at ON seen_messages (seen_at)")
+        await self._db.commit()
+
+    async def stop(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def claim(self, message_ids: Sequence[str]) -> List[bool]:
+        """Mark IDs as seen. Returns, in input order, True for each ID this call saw first.
+
+        An ID repeated within `message_ids` is only claimed by its first occurrence.
+        """
+        started = time.perf_counter()
+        now = time.time()
+        claimed = set()
+        for i in range(0, len(message_ids), self.BATCH_SIZE):
+            batch = list(dict.fromkeys(message_ids[i : i + self.BATCH_SIZE]))
+            # A conflicting row only counts as absent (and is taken over) if it has expired
+            sql = (
+                f"INSERT INTO seen_messages (id, seen_at) VALUES {', '.join(['(?, ?)'] * len(batch))} "
+                "ON CONFLICT (id) DO UPDATE SET seen_at = excluded.seen_at WHERE seen_messages.seen_at < ? "
+                "RETURNING id"
+            )
+            parameters = [value for message_id in batch for value in (message_id, now)] + [now - self.ttl]
+            async with self._db.execute(sql, parameters) as cursor:
+                claimed.update(row[0] for row in await cursor.fetchall())
+            await self._db.commit()
+
+        results = []
+        for message_id in message_ids:
+            results.append(message_id in claimed)
+            claimed.discard(message_id)
+
+        self._claimed += sum(results)
+        self._duplicates += len(results) - sum(results)
+        self._latencies.append(time.perf_counter() - started)
+        if now - self._last_purge > self.purge_interval:
+            await self.purge()
+        return results
+
+    async def release(self, message_ids: Sequence[str]) -> None:
+        """Forget IDs so that a redelivery is accepted again, e.g. after the job queue rejected them."""
+        await self._db.executemany("DELETE FROM seen_messages WHERE id = ?", [(message_id,) for message_id in message_ids])
+        await self._db.commit()
+
+    async def purge(self) -> int:
+        """Delete expired IDs. Returns the number of rows removed."""
+        self._last_purge = time.time()
+        cursor = await self._db.execute("DELETE FROM seen_messages WHERE seen_at < ?", (self._last_purge - self.ttl,))
+        await self._db.commit()
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Claims, duplicates caught and claim latency in this process."""
+        latencies = sorted(self._latencies)
+        total = self._claimed + self._duplicates
+        return {
+            "claimed": self._claimed,
+            "duplicates": self._duplicates,
+            "duplicate_rate": round(self._duplicates / total, 4) if total else 0.0,
+            "ttl_seconds": self.ttl,
+            "claim_ms_p50": round(latencies[len(latencies) // 2] * 1000, 3) if latencies else 0.0,
+            "claim_ms_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 3)
+            if latencies
+            else 0.0,
+        }
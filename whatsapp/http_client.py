@@ -0,0 +1,36 @@
+from typing import Optional
+
+import httpx
+
+from settings import settings
+
+GRAPH_API_BASE_URL = "https://graph.facebook.com/v21.0"
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get or create the pooled HTTP client shared by all Graph API calls.
+
+    Keeping a single client means connections (and their TLS sessions) to graph.facebook.com are reused
+    instead of being re-established for every download, upload and send.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=settings.GRAPH_API_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.GRAPH_API_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GRAPH_API_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(settings.GRAPH_API_TIMEOUT, connect=settings.GRAPH_API_CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the shared client and its connection pool."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,373 @@
+# In-process work queue for webhook jobs. The webhook endpoint enqueues parsed messages and returns immediately,
+# a bounded pool of asyncio workers drains the queue one job per user at a time (optionally merging a burst of
+# messages into one batch), and every job is mirrored in a SQLite table so that anything still pending when the
+# process stops is picked up again on the next start. Recovery takes every unfinished row, so only one process may
+# use a job table at a time; the app enforces that with a ProcessLock on the data directory.
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple
+
+import aiosqlite
+
+from modules.storage import configure_connection
+
+
+class QueueFullError(Exception):
+    """Raised when a job cannot be enqueued because the queue is at capacity."""
+
+
+@dataclass
+class Job:
+    """A unit of work waiting in the queue."""
+
+    key: str
+    payload: Dict[str, Any]
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    enqueued_at: float = field(default_factory=time.time)
+
+
+class JobQueue:
+    """Keyed job scheduler with a fixed worker pool and a persisted job table.
+
+    Jobs with the same key (the sender's phone number) run strictly one at a time, in arrival order, so a user's
+    messages never race on their checkpoint thread and their replies go out in order. Jobs with different keys run
+    in parallel, up to `workers` at once.
+
+    Keys are hashed into `shards`. Idle workers take the next ready key from each shard in turn and rotate through
+    the keys within a shard, so every waiting user gets a turn before anyone gets a second one, however many
+    messages a heavy user has queued. `max_pending_per_key` stops a single user from filling the queue.
+
+    With `debounce_ms` set, a key only becomes ready once no new job has arrived for it for `debounce_ms`, or once its
+    oldest job has waited `max_wait_ms`, and the handler then receives all of the key's pending jobs as one batch.
+    Without it, the handler receives one job at a time.
+
+    Jobs whose handler raised are marked failed and kept for inspection for `failed_ttl` seconds, then deleted by a
+    periodic sweep.
+    """
+
+    WAIT_SAMPLES = 1000  # Number of recent wait times kept for latency stats
+
+    def __init__(
+        self,
+        handler: Callable[[List[Job]], Awaitable[None]],
+        db_path: str,
+        workers: int = 4,
+        max_size: int = 100,
+        enqueue_timeout: float = 2.0,
+        shards: int = 16,
+        max_pending_per_key: int = 20,
+        debounce_ms: float = 0.0,
+        max_wait_ms: float = 3000.0,
+        failed_ttl: float = 7 * 24 * 3600,
+        prune_interval: float = 3600.0,
+    ):
+        self.handler = handler
+        self.db_path = db_path
+        self.workers = workers
+        self.max_size = max_size
+        self.enqueue_timeout = enqueue_timeout
+        self.shards = shards
+        self.max_pending_per_key = max_pending_per_key
+        self.debounce = debounce_ms / 1000
+        self.max_wait = max(max_wait_ms, debounce_ms) / 1000
+        self.failed_ttl = failed_ttl
+        self.prune_interval = prune_interval
+        self.logger = logging.getLogger(__name__)
+
+        # Scheduling state, guarded by _cond. A key is in a shard's ready deque only while it has pending jobs and
+        # none running, which is what keeps each key's jobs sequential.
+        self._cond: Optional[asyncio.Condition] = None
+        self._pending: Dict[str, Deque[Job]] = {}
+        self._running: Set[str] = set()
+        self._ready: List[Deque[str]] = [deque() for _ in range(shards)]
+        self._next_shard = 0
+        self._size = 0
+        self._debounce_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._timer_tasks: Set[asyncio.Task] = set()
+        self._db: Optional[aiosqlite.Connection] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._started_at = 0.0
+        self._processed = 0
+        self._batches = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_times: Deque[float] = deque(maxlen=self.WAIT_SAMPLES)
+
+    async def start(self) -> None:
+        """Open the job table, start the workers and re-enqueue jobs left over from a previous run."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._db = await aiosqlite.connect(self.db_path)
+        await configure_connection(self._db)
+        await self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        await self._db.commit()
+
+        self._cond = asyncio.Condition()
+        self._started_at = time.monotonic()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._prune_failed_forever()))
+
+        async with self._db.execute(
+            "SELECT id, key, payload, created_at FROM jobs WHERE status IN ('pending', 'running') ORDER BY created_at"
+        ) as cursor:
+            rows = await cursor.fetchall()
+        async with self._cond:
+            for job_id, key, payload, created_at in rows:
+                self._push(Job(key=key, payload=json.loads(payload), id=job_id, enqueued_at=created_at))
+        if rows:
+            self.logger.info(f"[job_queue] Recovered {len(rows)} unfinished job(s) from {self.db_path}")
+        self.logger.info(
+            f"[job_queue] Started {self.workers} worker(s) over {self.shards} shard(s), max queue size {self.max_size}"
+        )
+
+    async def stop(self) -> None:
+        """Stop the workers. Jobs that have not finished stay in the table and are recovered on the next start."""
+        for timer in self._debounce_timers.values():
+            timer.cancel()
+        self._debounce_timers.clear()
+        tasks = self._tasks + list(self._timer_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._timer_tasks.clear()
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+        self.logger.info("[job_queue] Stopped")
+
+    async def enqueue(self, key: str, payload: Dict[str, Any]) -> Job:
+        """Persist a job and schedule it behind any earlier jobs with the same key.
+
+        Raises:
+            QueueFullError: If the key already has `max_pending_per_key` jobs waiting, or the queue stays full for
+                longer than `enqueue_timeout`.
+        """
+        [job] = await self.enqueue_many([(key, payload)])
+        if job is None:
+            raise QueueFullError(f"Job queue is full ({self.max_size} jobs) or {key} has too many pending jobs")
+        return job
+
+    async def enqueue_many(self, items: Sequence[Tuple[str, Dict[str, Any]]]) -> List[Optional[Job]]:
+        """Persist several jobs in one transaction and schedule them in order.
+
+        A job is rejected if its key already has `max_pending_per_key` jobs waiting, or if the queue is still full
+        once `enqueue_timeout` (shared by the whole call) has run out.
+
+        Returns:
+            The scheduled jobs in input order, with None in place of each rejected job.
+
+        Raises:
+            Exception: Only if persisting the jobs fails, in which case none of them was scheduled.
+        """
+        jobs = [Job(key=key, payload=payload) for key, payload in items]
+        await self._db.executemany(
+            "INSERT INTO jobs (id, key, payload, status, created_at, updated_at) VALUES (?, ?, ?, 'pending', ?, ?)",
+            [(job.id, job.key, json.dumps(job.payload), job.enqueued_at, job.enqueued_at) for job in jobs],
+        )
+        await self._db.commit()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.enqueue_timeout
+        scheduled: List[Optional[Job]] = []
+        async with self._cond:
+            for job in jobs:
+                if len(self._pending.get(job.key, ())) >= self.max_pending_per_key:
+                    scheduled.append(None)
+                    continue
+                if self._size >= self.max_size:
+                    try:
+                        await asyncio.wait_for(
+                            self._cond.wait_for(lambda: self._size < self.max_size),
+                            timeout=max(deadline - loop.time(), 0),
+                        )
+                    except asyncio.TimeoutError:
+                        scheduled.append(None)
+                        continue
+                self._push(job)
+                scheduled.append(job)
+
+        rejected = [job for job, accepted in zip(jobs, scheduled) if accepted is None]
+        if rejected:
+            self._rejected += len(rejected)
+            try:
+                await self._db.executemany("DELETE FROM jobs WHERE id = ?", [(job.id,) for job in rejected])
+                await self._db.commit()
+            except Exception as e:
+                # The others are already scheduled, so the call must not fail now
+                self.logger.error(f"[job_queue] Could not delete {len(rejected)} rejected job(s): {e}", exc_info=True)
+        return scheduled
+
+    def _shard(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % self.shards
+
+    def _push(self, job: Job) -> None:
+        """Append a job to its key's queue. Caller holds _cond."""
+        self._pending.setdefault(job.key, deque()).append(job)
+        self._size += 1
+        if job.key not in self._running and job.key not in self._ready[self._shard(job.key)]:
+            self._schedule_ready(job.key)
+        self._cond.notify_all()
+
+    def _schedule_ready(self, key: str) -> None:
+        """Make a key ready now, or once its debounce window closes. Caller holds _cond."""
+        timer = self._debounce_timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        jobs = self._pending[key]
+        delay = min(jobs[-1].enqueued_at + self.debounce, jobs[0].enqueued_at + self.max_wait) - time.time()
+        if not self.debounce or delay <= 0:
+            self._ready[self._shard(key)].append(key)
+            self._cond.notify_all()
+            return
+        self._debounce_timers[key] = asyncio.get_running_loop().call_later(delay, self._debounce_elapsed, key)
+
+    def _debounce_elapsed(self, key: str) -> None:
+        task = asyncio.create_task(self._mark_ready(key))
+        self._timer_tasks.add(task)
+        task.add_done_callback(self._timer_tasks.discard)
+
+    async def _mark_ready(self, key: str) -> None:
+        async with self._cond:
+            self._debounce_timers.pop(key, None)
+            if key in self._pending and key not in self._running and key not in self._ready[self._shard(key)]:
+                self._ready[self._shard(key)].append(key)
+                self._cond.notify_all()
+
+    def _has_ready(self) -> bool:
+        return any(self._ready)
+
+    def _pop(self) -> List[Job]:
+        """Take the next key's job(s) round-robin across shards, then across keys. Caller holds _cond."""
+        for offset in range(self.shards):
+            shard = (self._next_shard + offset) % self.shards
+            if self._ready[shard]:
+                key = self._ready[shard].popleft()
+                self._next_shard = (shard + 1) % self.shards
+                break
+        jobs = self._pending[key]
+        # With debouncing on, the whole burst goes to the handler together
+        batch = list(jobs) if self.debounce else [jobs[0]]
+        for _ in batch:
+            jobs.popleft()
+        if not jobs:
+            del self._pending[key]
+        self._running.add(key)
+        self._size -= len(batch)
+        self._cond.notify_all()
+        return batch
+
+    def _release(self, key: str) -> None:
+        """Mark a key's job as finished and requeue the key at the back of its shard. Caller holds _cond."""
+        self._running.discard(key)
+        if key in self._pending:
+            self._schedule_ready(key)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(self._has_ready)
+                batch = self._pop()
+            key = batch[0].key
+            started = time.monotonic()
+            self._wait_times.extend(max(time.time() - job.enqueued_at, 0.0) for job in batch)
+            self._busy += 1
+            try:
+                await self._run_batch(index, batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Only the bookkeeping around the handler gets here; the worker must keep serving its shards
+                self.logger.error(f"[job_queue] Worker {index} could not record {len(batch)} job(s) for {key}: {e}", exc_info=True)
+            finally:
+                self._busy -= 1
+                self._busy_seconds += time.monotonic() - started
+                async with self._cond:
+                    self._release(key)
+
+    async def _run_batch(self, index: int, batch: List[Job]) -> None:
+        await self._set_status(batch, "running")
+        try:
+            await self.handler(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._failed += len(batch)
+            self.logger.error(f"[job_queue] Worker {index} failed {len(batch)} job(s) for {batch[0].key}: {e}", exc_info=True)
+            await self._set_status(batch, "failed", error=str(e))
+            return
+        self._processed += len(batch)
+        self._batches += 1
+        await self._db.executemany("DELETE FROM jobs WHERE id = ?", [(job.id,) for job in batch])
+        await self._db.commit()
+
+    async def _prune_failed_forever(self) -> None:
+        while True:
+            try:
+                cursor = await self._db.execute(
+                    "DELETE FROM jobs WHERE status = 'failed' AND updated_at < ?", (time.time() - self.failed_ttl,)
+                )
+                await self._db.commit()
+                if cursor.rowcount > 0:
+                    self.logger.info(f"[job_queue] Pruned {cursor.rowcount} failed job(s)")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"[job_queue] Pruning failed jobs failed: {e}", exc_info=True)
+            await asyncio.sleep(self.prune_interval)
+
+    async def _set_status(self, batch: List[Job], status: str, error: Optional[str] = None) -> None:
+        now = time.time()
+        await self._db.executemany(
+            "UPDATE jobs SET status = ?, attempts = attempts + ?, error = ?, updated_at = ? WHERE id = ?",
+            [(status, 1 if status == "running" else 0, error, now, job.id) for job in batch],
+        )
+        await self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, wait times, worker utilisation and coalescing."""
+        waits = sorted(self._wait_times)
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            "depth": self._size,
+            "max_size": self.max_size,
+            "waiting_keys": len(self._pending),
+            "running_keys": len(self._running),
+            "max_key_depth": max((len(jobs) for jobs in self._pending.values()), default=0),
+            "shards": self.shards,
+            "workers": self.workers,
+            "busy_workers": self._busy,
+            "utilisation": round(self._busy_seconds / (uptime * self.workers), 4) if uptime else 0.0,
+            "processed": self._processed,
+            "batches": self._batches,
+            # Jobs handled as part of another job's batch instead of on their own
+            "coalesced": self._processed - self._batches,
+            "debounce_ms": self.debounce * 1000,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "wait_seconds_avg": round(sum(waits) / len(waits), 4) if waits else 0.0,
+            "wait_seconds_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 4) if waits else 0.0,
+        }
@@ -0,0 +1,94 @@
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+import aiosqlite
+
+from modules.storage import configure_connection
+
+
+class MediaUploadCache:
+    """Maps uploaded media content to its WhatsApp media ID, so identical media is only uploaded once.
+
+    Entries are keyed by the blob store reference, which is the SHA-256 of the content, and the business phone
+    number the media was uploaded for. WhatsApp deletes uploaded media after 30 days, so entries expire after `ttl`,
+    a day short of that by default.
+    """
+
+    def __init__(self, db_path: str, ttl: float = 29 * 24 * 3600):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+
+        self._db: Optional[aiosqlite.Connection] = None
+        self._hits = 0
+        self._misses = 0
+        self._bytes_saved = 0
+        self._bytes_uploaded = 0
+
+    async def start(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._db = await aiosqlite.connect(self.db_path)
+        await configure_connection(self._db)
+        await self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS media_uploads (
+                content_ref TEXT NOT NULL,
+                phone_number_id TEXT NOT NULL,
+                media_id TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                uploaded_at REAL NOT NULL,
+                PRIMARY KEY (content_ref, phone_number_id)
+            )
+            """
+        )
+        await self._db.execute("DELETE FROM media_uploads WHERE uploaded_at < ?", (time.time() - self.ttl,))
+        await self._db.commit()
+
+    async def stop(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def get(self, content_ref: str, phone_number_id: str) -> Optional[str]:
+        """The media ID of an earlier upload of this content that has not expired yet, if any."""
+        async with self._db.execute(
+            "SELECT media_id, size FROM media_uploads WHERE content_ref = ? AND phone_number_id = ? AND uploaded_at >= ?",
+            (content_ref, phone_number_id, time.time() - self.ttl),
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._bytes_saved += row[1]
+        return row[0]
+
+    async def put(self, content_ref: str, phone_number_id: str, media_id: str, size: int) -> None:
+        self._bytes_uploaded += size
+        await self._db.execute(
+            "INSERT OR REPLACE INTO media_uploads (content_ref, phone_number_id, media_id, size, uploaded_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (content_ref, phone_number_id, media_id, size, time.time()),
+        )
+        await self._db.commit()
+
+    async def invalidate(self, content_ref: str, phone_number_id: str) -> None:
+        """Forget a media ID that WhatsApp no longer accepts."""
+        await self._db.execute(
+            "DELETE FROM media_uploads WHERE content_ref = ? AND phone_number_id = ?", (content_ref, phone_number_id)
+        )
+        await self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and the upload bytes it saved."""
+        lookups = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "bytes_saved": self._bytes_saved,
+            "bytes_uploaded": self._bytes_uploaded,
+            "ttl_seconds": self.ttl,
+        }
@@ -0,0 +1,467 @@
+# Outbound side of the WhatsApp integration. Replies are persisted and handed to a small pool of senders that
+# respect Meta's per-number throughput limit, retry 429s, 5xx and network errors with jittered exponential backoff,
+# and keep each recipient's replies in order.
+
+import asyncio
+import json
+import logging
+import mimetypes
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Set
+
+import aiosqlite
+import httpx
+
+from modules.storage import configure_connection, get_blob_store
+from settings import settings
+from whatsapp.http_client import GRAPH_API_BASE_URL, get_http_client
+from whatsapp.media_cache import MediaUploadCache
+
+
+class SendError(Exception):
+    """A Graph API call failed. `retryable` is set for rate limiting, server errors and network failures."""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retryable: bool = False,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+@dataclass
+class OutboundMessage:
+    """A reply waiting to be sent. Media is referenced by blob store key, never held in the queue."""
+
+    to: str
+    type: str
+    text: str
+    phone_number_id: str
+    media_ref: Optional[str] = None
+    id: Optional[int] = None
+    attempts: int = 0
+    created_at: float = field(default_factory=time.time)
+    next_attempt_at: float = 0.0
+
+
+class TokenBucket:
+    """Async token bucket: allows `rate` acquisitions per second on average and bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Take one token, waiting for it if needed. Returns how long the caller waited, in seconds."""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+def _raise_for_status(response: httpx.Response, action: str) -> None:
+    if response.status_code == 200:
+        return
+    retryable = response.status_code == 429 or response.status_code >= 500
+    retry_after = response.headers.get("Retry-After")
+    raise SendError(
+        f"{action} failed with {response.status_code}: {response.text}",
+        status_code=response.status_code,
+        retryable=retryable,
+        retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+    )
+
+
+async def upload_media(media_content: bytes, filename: str, phone_number_id: str) -> str:
+    """Upload media to WhatsApp servers and return its media ID. The MIME type follows the filename's extension."""
+    mime_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = {"Authorization": f"Bearer {settings.WHATSAPP_TOKEN}"}
+    files = {"file": (filename, media_content, mime_type)}
+    data = {"messaging_product": "whatsapp", "type": mime_type}
+
+    response = await get_http_client().post(
+        f"{GRAPH_API_BASE_URL}/{phone_number_id}/media",
+        headers=headers,
+        files=files,
+        data=data,
+    )
+    _raise_for_status(response, "Media upload")
+    result = response.json()
+
+    if "id" not in result:
+        raise SendError("Failed to upload media")
+    return result["id"]
+
+
+class SendQueue:
+    """Persisted outbound queue for WhatsApp replies.
+
+    Messages are written to SQLite before they are queued and deleted once Meta accepts them, so replies that are
+    pending when the process stops are sent on the next start. `concurrency` senders share one token bucket per
+    business phone number ID (`rate_per_second`, bursting to `burst`). A recipient never has more than one message
+    in flight, and a message waiting for a retry holds back the later messages to the same recipient, so replies
+    arrive in order. Retryable failures back off exponentially with full jitter (or as long as Retry-After asks);
+    after `max_attempts` the message is marked failed and kept in the table until it is `failed_ttl` seconds old.
+
+    Once a message is delivered, its media blob is deleted unless another pending message still refers to it (the
+    media ID cache lets a later identical reply go out without the file). A background sweep every
+    `blob_purge_interval` seconds also removes blobs older than `blob_ttl` that no pending message refers to, and
+    failed messages past `failed_ttl`.
+    """
+
+    LATENCY_SAMPLES = 1000
+
+    def __init__(
+        self,
+        db_path: str,
+        concurrency: int = 8,
+        rate_per_second: float = 80.0,
+        burst: float = 80.0,
+        max_attempts: int = 6,
+        retry_base_delay: float = 1.0,
+        retry_max_delay: float = 60.0,
+        media_cache_ttl: float = 29 * 24 * 3600,
+        blob_ttl: float = 7 * 24 * 3600,
+        blob_purge_interval: float = 3600.0,
+        failed_ttl: float = 7 * 24 * 3600,
+    ):
+        self.db_path = db_path
+        self.concurrency = concurrency
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.blob_ttl = blob_ttl
+        self.blob_purge_interval = blob_purge_interval
+        self.failed_ttl = failed_ttl
+        self.logger = logging.getLogger(__name__)
+        self.media_cache = MediaUploadCache(db_path, ttl=media_cache_ttl)
+
+        self._db: Optional[aiosqlite.Connection] = None
+        self._tasks: List[asyncio.Task] = []
+        self._cond: Optional[asyncio.Condition] = None
+        self._pending: List[OutboundMessage] = []  # In submission order
+        self._in_flight: Set[str] = set()
+        self._buckets: Dict[str, TokenBucket] = {}
+
+        self._sent = 0
+        self._failed = 0
+        self._failed_purged = 0
+        self._blobs_deleted = 0
+        self._blob_bytes_freed = 0
+        self._retries: Dict[str, int] = {}
+        self._throttled_seconds = 0.0
+        self._send_latencies: Deque[float] = deque(maxlen=self.LATENCY_SAMPLES)
+        self._api_latencies: Deque[float] = deque(maxlen=self.LATENCY_SAMPLES)
+
+    async def start(self) -> None:
+        """Open the table, start the senders and re-queue messages left over from a previous run."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._db = await aiosqlite.connect(self.db_path)
+        await configure_connection(self._db)
+        await self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbound_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        await self._db.commit()
+        await self.media_cache.start()
+
+        self._cond = asyncio.Condition()
+        async with self._db.execute(
+            "SELECT id, message, attempts FROM outbound_messages WHERE status = 'pending' ORDER BY id"
+        ) as cursor:
+            rows = await cursor.fetchall()
+        for message_id, message, attempts in rows:
+            self._pending.append(OutboundMessage(**{**json.loads(message), "id": message_id, "attempts": attempts}))
+        if rows:
+            self.logger.info(f"[send_queue] Recovered {len(rows)} unsent message(s)")
+        self._tasks = [asyncio.create_task(self._sender()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._purge_forever()))
+
+    async def stop(self) -> None:
+        """Stop the senders. Unsent messages stay in the table for the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+        await self.media_cache.stop()
+
+    async def submit(self, to: str, text: str, message_type: str = "text", media_ref: Optional[str] = None) -> None:
+        """Persist a reply and queue it for sending. Returns without waiting for the Graph API."""
+        message = OutboundMessage(
+            to=to,
+            type=message_type,
+            text=text,
+            media_ref=media_ref,
+            phone_number_id=settings.WHATSAPP_PHONE_NUMBER_ID,
+        )
+        fields = {key: getattr(message, key) for key in ("to", "type", "text", "media_ref", "phone_number_id", "created_at")}
+        cursor = await self._db.execute(
+            "INSERT INTO outbound_messages (message, created_at) VALUES (?, ?)", (json.dumps(fields), message.created_at)
+        )
+        await self._db.commit()
+        message.id = cursor.lastrowid
+        async with self._cond:
+            self._pending.append(message)
+            self._cond.notify_all()
+
+    def _next_ready(self) -> Optional[OutboundMessage]:
+        """First message that is due and whose recipient has nothing in flight or ahead of it. Caller holds _cond."""
+        now = time.time()
+        blocked = set(self._in_flight)
+        for message in self._pending:
+            if message.to in blocked:
+                continue
+            if message.next_attempt_at <= now:
+                return message
+            blocked.add(message.to)
+        return None
+
+    def _next_due_in(self) -> Optional[float]:
+        """Seconds until the earliest retry becomes due, or None to wait for a submission. Caller holds _cond."""
+        seen = set(self._in_flight)
+        due = []
+        for message in self._pending:
+            if message.to not in seen:
+                seen.add(message.to)
+                due.append(message.next_attempt_at)
+        return max(min(due) - time.time(), 0.0) if due else None
+
+    async def _sender(self) -> None:
+        while True:
+            async with self._cond:
+                while (message := self._next_ready()) is None:
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout=self._next_due_in())
+                    except asyncio.TimeoutError:
+                        pass
+                self._pending.remove(message)
+                self._in_flight.add(message.to)
+            try:
+                await self._attempt(message)
+            except Exception as e:
+                # Only bookkeeping can fail here; a dead sender would stall every recipient it would have served
+                self.logger.error(f"[send_queue] Error handling message {message.id} to {message.to}: {e}", exc_info=True)
+            finally:
+                async with self._cond:
+                    self._in_flight.discard(message.to)
+                    self._cond.notify_all()
+
+    async def _attempt(self, message: OutboundMessage) -> None:
+        """Deliver a message and record the outcome.
+
+        The message is re-queued in memory before anything is written, so a database error afterwards cannot lose
+        it; the row then only lags behind until the next successful write or restart.
+        """
+        message.attempts += 1
+        try:
+            await self._deliver(message)
+        except Exception as e:
+            retryable = isinstance(e, httpx.TransportError) or (isinstance(e, SendError) and e.retryable)
+            if retryable and message.attempts < self.max_attempts:
+                reason = f"http_{e.status_code}" if isinstance(e, SendError) else type(e).__name__
+                self._retries[reason] = self._retries.get(reason, 0) + 1
+                delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (message.attempts - 1)))
+                if isinstance(e, SendError) and e.retry_after:
+                    delay = max(delay, e.retry_after)
+                message.next_attempt_at = time.time() + delay
+                async with self._cond:
+                    # Back at the front: later replies to the same recipient must not overtake it
+                    self._pending.insert(0, message)
+                self.logger.warning(f"[send_queue] Send to {message.to} failed (attempt {message.attempts}), retrying in {delay:.1f}s: {e}")
+                await self._record(
+                    "UPDATE outbound_messages SET attempts = ?, error = ? WHERE id = ?", (message.attempts, str(e), message.id)
+                )
+                return
+            self._failed += 1
+            self.logger.error(f"[send_queue] Giving up on message {message.id} to {message.to}: {e}")
+            await self._record(
+                "UPDATE outbound_messages SET status = 'failed', attempts = ?, error = ? WHERE id = ?",
+                (message.attempts, str(e), message.id),
+            )
+            return
+
+        self._sent += 1
+        self._send_latencies.append(time.time() - message.created_at)
+        # If this fails the row stays pending and the message is sent again after a restart, which beats losing it
+        await self._record("DELETE FROM outbound_messages WHERE id = ?", (message.id,))
+        if message.media_ref:
+            await self._release_blob(message.media_ref)
+
+    async def _record(self, sql: str, parameters: tuple) -> None:
+        """Write a message's outcome to the table, logging instead of raising if the write fails."""
+        try:
+            await self._db.execute(sql, parameters)
+            await self._db.commit()
+        except Exception as e:
+            self.logger.error(f"[send_queue] Could not record outcome ({sql.split()[0]}): {e}", exc_info=True)
+
+    async def _pending_media_refs(self, ref: Optional[str] = None) -> Set[str]:
+        """Blob references of messages still waiting to be sent, optionally only those equal to `ref`."""
+        sql = "SELECT DISTINCT json_extract(message, '$.media_ref') FROM outbound_messages WHERE status = 'pending'"
+        if ref is not None:
+            sql += " AND json_extract(message, '$.media_ref') = ?"
+        async with self._db.execute(sql, (ref,) if ref is not None else ()) as cursor:
+            return {row[0] for row in await cursor.fetchall() if row[0]}
+
+    async def _release_blob(self, ref: str) -> None:
+        """Delete a delivered message's blob once no pending message refers to it. The purge sweep retries failures."""
+        try:
+            if await self._pending_media_refs(ref):
+                return
+            if get_blob_store().delete(ref):
+                self._blobs_deleted += 1
+        except Exception as e:
+            self.logger.warning(f"[send_queue] Could not delete blob {ref}: {e}")
+
+    async def _purge_forever(self) -> None:
+        while True:
+            try:
+                cursor = await self._db.execute(
+                    "DELETE FROM outbound_messages WHERE status = 'failed' AND created_at < ?", (time.time() - self.failed_ttl,)
+                )
+                await self._db.commit()
+                if cursor.rowcount:
+                    self._failed_purged += cursor.rowcount
+                    self.logger.info(f"[send_queue] Purged {cursor.rowcount} expired failed message(s)")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"[send_queue] Failed message purge failed: {e}", exc_info=True)
+            try:
+                keep = await self._pending_media_refs()
+                removed, freed = await asyncio.to_thread(get_blob_store().purge, self.blob_ttl, keep)
+                self._blobs_deleted += removed
+                self._blob_bytes_freed += freed
+                if removed:
+                    self.logger.info(f"[send_queue] Purged {removed} expired blob(s), {freed / 1e6:.1f} MB")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"[send_queue] Blob purge failed: {e}", exc_info=True)
+            await asyncio.sleep(self.blob_purge_interval)
+
+    async def _deliver(self, message: OutboundMessage) -> None:
+        """Upload the media if any, then send the message. Falls back to text if the media cannot be uploaded.
+
+        Media that was already uploaded (same content, same phone number) reuses its media ID from the cache.
+        """
+        message_type = message.type
+        json_data = {"messaging_product": "whatsapp", "to": message.to}
+        media_id = None
+        if message_type in ["audio", "image"]:
+            try:
+                media_id = await self.media_cache.get(message.media_ref, message.phone_number_id)
+                cached = media_id is not None
+                if not cached:
+                    # The blob reference is "<sha256>.<ext>", so it also gives the upload a filename of the right type
+                    media_content = get_blob_store().get(message.media_ref)
+                    media_id = await upload_media(media_content, message.media_ref, message.phone_number_id)
+                    await self.media_cache.put(message.media_ref, message.phone_number_id, media_id, len(media_content))
+                json_data.update({"type": message_type, message_type: {"id": media_id}})
+                # Add caption for images
+                if message_type == "image":
+                    json_data["image"]["caption"] = message.text
+            except (httpx.TransportError, SendError) as e:
+                if isinstance(e, httpx.TransportError) or e.retryable:
+                    raise
+                self.logger.error(f"[send_queue] Media upload failed, falling back to text: {e}")
+                message_type, media_id = "text", None
+            except OSError as e:
+                self.logger.error(f"[send_queue] Media {message.media_ref} unavailable, falling back to text: {e}")
+                message_type, media_id = "text", None
+
+        if message_type == "text":
+            json_data.update({"type": "text", "text": {"body": message.text}})
+
+        bucket = self._buckets.setdefault(message.phone_number_id, TokenBucket(self.rate_per_second, self.burst))
+        self._throttled_seconds += await bucket.acquire()
+        started = time.perf_counter()
+        response = await get_http_client().post(
+            f"{GRAPH_API_BASE_URL}/{message.phone_number_id}/messages",
+            headers={"Authorization": f"Bearer {settings.WHATSAPP_TOKEN}", "Content-Type": "application/json"},
+            json=json_data,
+        )
+        self._api_latencies.append(time.perf_counter() - started)
+        try:
+            _raise_for_status(response, "Send")
+        except SendError as e:
+            if media_id is None or not cached or e.retryable:
+                raise
+            # WhatsApp may have dropped the media early; upload it again on the next attempt
+            await self.media_cache.invalidate(message.media_ref, message.phone_number_id)
+            raise SendError(f"{e} (cached media ID dropped)", status_code=e.status_code, retryable=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Backlog, outcomes, retries by cause, time spent throttled and send latency."""
+
+        def percentile(samples: Deque[float], q: float) -> float:
+            values = sorted(samples)
+            return round(values[min(len(values) - 1, int(len(values) * q))], 4) if values else 0.0
+
+        return {
+            "pending": len(self._pending),
+            "in_flight": len(self._in_flight),
+            "sent": self._sent,
+            "failed": self._failed,
+            "failed_purged": self._failed_purged,
+            "retries": sum(self._retries.values()),
+            "retries_by_cause": dict(self._retries),
+            "throttled_seconds": round(self._throttled_seconds, 3),
+            "send_latency_seconds_p50": percentile(self._send_latencies, 0.5),
+            "send_latency_seconds_p95": percentile(self._send_latencies, 0.95),
+            "api_latency_seconds_p95": percentile(self._api_latencies, 0.95),
+            "blobs_deleted": self._blobs_deleted,
+            "blob_bytes_freed_by_purge": self._blob_bytes_freed,
+            "media_cache": self.media_cache.stats(),
+        }
+
+
+@lru_cache
+def get_send_queue() -> SendQueue:
+    """Get or create the SendQueue singleton instance."""
+    return SendQueue(
+        db_path=settings.SEND_QUEUE_DB_PATH,
+        concurrency=settings.SEND_CONCURRENCY,
+        rate_per_second=settings.SEND_RATE_PER_SECOND,
+        burst=settings.SEND_BURST,
+        max_attempts=settings.SEND_MAX_ATTEMPTS,
+        retry_base_delay=settings.SEND_RETRY_BASE_DELAY,
+        retry_max_delay=settings.SEND_RETRY_MAX_DELAY,
+        media_cache_ttl=settings.MEDIA_UPLOAD_CACHE_TTL_DAYS * 24 * 3600,
+        blob_ttl=settings.MEDIA_BLOB_TTL_DAYS * 24 * 3600,
+        failed_ttl=settings.SEND_FAILED_TTL_DAYS * 24 * 3600,
+    )
@@ -1,8 +1,24 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
+from functools import partial
 
 from fastapi import FastAPI
 
-from whatsapp.whatsapp_response import whatsapp_router
+from graph.graph import open_agent_graph
+from graph.summarizer import get_conversation_summarizer
+from graph.utils.intent_classifier import get_intent_classifier
+from modules.image import TextToImage, get_vision_cache
+from modules.memory import get_memory_extraction_queue
+from modules.memory.vector_store import get_vector_store
+from modules.speech import get_transcription_cache
+from modules.storage import CheckpointRetention, ProcessLock
+from settings import settings
+from whatsapp.dedup_store import DedupStore
+from whatsapp.http_client import close_http_client, get_http_client
+from whatsapp.job_queue import JobQueue
+from whatsapp.send_queue import get_send_queue
+from whatsapp.whatsapp_response import process_message, whatsapp_router
 
 logging.basicConfig(
     level=logging.INFO,
@@ -10,5 +26,89 @@ logging.basicConfig(
     datefmt="%H:%M:%S",
 )
 
-app = FastAPI()
-app.include_router(whatsapp_router)
\ No newline at end of file
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The queues below recover every unfinished row on start, so a second process on the same data directory would
+    # re-run work this one is still doing. Refuse to start instead.
+    process_lock = ProcessLock(f"{settings.JOB_QUEUE_DB_PATH}.lock")
+    process_lock.acquire()
+    get_http_client()
+    # Load the embedding model and check the Qdrant collection before the first message arrives
+    await asyncio.to_thread(get_vector_store)
+    await get_memory_extraction_queue().start()
+    app.state.dedup_store = DedupStore(settings.DEDUP_DB_PATH, ttl=settings.DEDUP_TTL)
+    await app.state.dedup_store.start()
+    await get_send_queue().start()
+    # One checkpointer connection and one compiled graph shared by every request
+    async with open_agent_graph(settings.SHORT_TERM_MEMORY_DB_PATH) as agent_graph:
+        app.state.agent_graph = agent_graph
+        app.state.checkpoint_retention = CheckpointRetention(
+            agent_graph.checkpointer,
+            db_path=settings.SHORT_TERM_MEMORY_DB_PATH,
+            keep_last=settings.CHECKPOINT_KEEP_LAST,
+            thread_ttl=settings.CHECKPOINT_THREAD_TTL_DAYS * 24 * 3600,
+            interval=settings.CHECKPOINT_RETENTION_INTERVAL,
+            vacuum_pages=settings.CHECKPOINT_VACUUM_PAGES,
+        )
+        await app.state.checkpoint_retention.start()
+        app.state.job_queue = JobQueue(
+            handler=partial(process_message, agent_graph),
+            db_path=settings.JOB_QUEUE_DB_PATH,
+            workers=settings.JOB_QUEUE_WORKERS,
+            max_size=settings.JOB_QUEUE_MAX_SIZE,
+            enqueue_timeout=settings.JOB_QUEUE_ENQUEUE_TIMEOUT,
+            shards=settings.JOB_QUEUE_SHARDS,
+            max_pending_per_key=settings.JOB_QUEUE_MAX_PENDING_PER_KEY,
+            debounce_ms=settings.JOB_QUEUE_DEBOUNCE_MS,
+            max_wait_ms=settings.JOB_QUEUE_DEBOUNCE_MAX_WAIT_MS,
+            failed_ttl=settings.JOB_QUEUE_FAILED_TTL_DAYS * 24 * 3600,
+        )
+        await app.state.job_queue.start()
+        yield
+        # Stop the workers, then the summaries they scheduled, before the checkpointer connection is closed
+        await app.state.job_queue.stop()
+        await get_conversation_summarizer().stop()
+        await app.state.checkpoint_retention.stop()
+    await get_memory_extraction_queue().stop()
+    await get_send_queue().stop()
+    await get_transcription_cache().stop()
+    await get_vision_cache().stop()
+    await app.state.dedup_store.stop()
+    await close_http_client()
+    await TextToImage.close()
+    get_vector_store().embedding_cache.save()
+    process_lock.release()
+
+
+app = FastAPI(lifespan=lifespan)
+app.include_router(whatsapp_router)
+
+
+@app.get("/metrics")
+async def metrics() -> dict:
+    """Runtime stats for the background queues, the embedding service, the router and checkpoint storage."""
+    vector_store = get_vector_store()
+    job_queue = app.state.job_queue.stats()
+    router = get_intent_classifier().stats()
+    # Each graph run makes one memory-analysis call and one reply call, plus a router call when the local tier
+    # cannot decide, and sends one WhatsApp message
+    runs_saved = job_queue["coalesced"]
+    return {
+        "job_queue": job_queue,
+        "dedup": app.state.dedup_store.stats(),
+        "send_queue": get_send_queue().stats(),
+        "transcription_cache": get_transcription_cache().stats(),
+        "vision_cache": get_vision_cache().stats(),
+        "coalescing": {
+            "graph_runs_saved": runs_saved,
+            "llm_calls_saved_estimate": round(runs_saved * (2 + router["llm_call_rate"]), 1),
+            "sends_saved": runs_saved,
+        },
+        "memory_queue": get_memory_extraction_queue().stats(),
+        "embeddings": vector_store.embedder.stats(),
+        "embedding_cache": vector_store.embedding_cache.stats(),
+        "router": router,
+        "summarizer": get_conversation_summarizer().stats(),
+        "checkpoints": await app.state.checkpoint_retention.stats(),
+    }
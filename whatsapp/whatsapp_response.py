@@ -1,21 +1,21 @@
 # Handles incoming messages and status updates from the WhatsApp Cloud API, processes them through the graph agent, and sends appropriate responses back to users. 
 # Supports text, audio, and image messages, with media analysis and transcription capabilities.
 
+import asyncio
 import logging
-import os
-from collections import OrderedDict
-from io import BytesIO
-from typing import Dict
+from typing import Dict, List, Tuple
 
-import httpx
 from fastapi import APIRouter, Request, Response
 from langchain_core.messages import HumanMessage
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph.state import CompiledStateGraph
 
-from graph import graph_builder
+from graph.summarizer import get_conversation_summarizer
 from modules.image import ImageToText
-from modules.speech import SpeechToText, TextToSpeech
+from modules.speech import SpeechToText, TextToSpeech, get_transcription_cache
 from settings import settings
+from whatsapp.http_client import GRAPH_API_BASE_URL, get_http_client
+from whatsapp.job_queue import Job
+from whatsapp.send_queue import get_send_queue
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +24,6 @@ speech_to_text = SpeechToText()
 text_to_speech = TextToSpeech()
 image_to_text = ImageToText()
 
-# Deduplication cache: stores recently seen message IDs (max 500 entries)
-_PROCESSED_MESSAGE_IDS: OrderedDict = OrderedDict()
-_MAX_CACHE_SIZE = 500
-
 # Router for WhatsApp respo
 whatsapp_router = APIRouter()
 
@@ -45,198 +41,185 @@ async def whatsapp_verify(request: Request) -> Response:
     return Response(content="Verification token mismatch", status_code=403)
 
 
+def parse_webhook_events(data: Dict) -> Tuple[List[Dict], List[Dict]]:
+    """Collect every message and status update in a webhook payload.
+
+    Meta batches several entries, changes and messages into one delivery under load, so all of them are read.
+    """
+    messages, statuses = [], []
+    for entry in data.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            messages.extend(value.get("messages", []))
+            statuses.extend(value.get("statuses", []))
+    return messages, statuses
+
+
 @whatsapp_router.post("/whatsapp_response")
 async def whatsapp_handler(request: Request) -> Response:
-    """Handles incoming messages and status updates from the WhatsApp Cloud API."""
+    """Handles incoming messages and status updates from the WhatsApp Cloud API.
+
+    Messages are only parsed and queued here; the agent runs in the background job queue so that Meta gets its
+    200 straight away instead of waiting on transcription, the graph and the reply. Every message in the delivery
+    is deduplicated and the new ones are queued together in one call.
+    """
     try:
         data = await request.json()
-        change_value = data["entry"][0]["changes"][0]["value"]
-        if "messages" in change_value:
-            message = change_value["messages"][0]
-            message_id = message.get("id", "")
-
-            # Deduplicate: Meta delivers the same webhook from multiple data centers
-            if message_id in _PROCESSED_MESSAGE_IDS:
-                logger.debug(f"[dedup] Skipping already-processed message {message_id}")
-                return Response(content="Duplicate message", status_code=200)
-            _PROCESSED_MESSAGE_IDS[message_id] = True
-            if len(_PROCESSED_MESSAGE_IDS) > _MAX_CACHE_SIZE:
-                _PROCESSED_MESSAGE_IDS.popitem(last=False)  # evict oldest
-
-            from_number = message["from"]
-            session_id = from_number
-
-            # Get user message and handle different message types
-            content = ""
-            if message["type"] == "audio":
-                content = await process_audio_message(message)
-            elif message["type"] == "image":
-                # Get image caption if any
-                content = message.get("image", {}).get("caption", "")
-                # Download and analyze image
-                image_bytes = await download_media(message["image"]["id"])
-                try:
-                    description = await image_to_text.analyze_image(
-                        image_bytes,
-                        "Please describe what you see in this image in the context of our conversation.",
-                    )
-                    content += f"\n[Image Analysis: {description}]"
-                except Exception as e:
-                    logger.warning(f"Failed to analyze image: {e}")
-            else:
-                content = message["text"]["body"]
-
-            # Process message through the graph agent
-            os.makedirs(os.path.dirname(os.path.abspath(settings.SHORT_TERM_MEMORY_DB_PATH)), exist_ok=True)
-            async with AsyncSqliteSaver.from_conn_string(settings.SHORT_TERM_MEMORY_DB_PATH) as short_term_memory:
-                graph = graph_builder.compile(checkpointer=short_term_memory)
-                await graph.ainvoke(
-                    {"messages": [HumanMessage(content=content)]},
-                    {"configurable": {"thread_id": session_id}},
-                )
-
-                # Get the workflow type and response from the state
-                output_state = await graph.aget_state(config={"configurable": {"thread_id": session_id}})
-
-            workflow = output_state.values.get("workflow", "conversation")
-            response_message = output_state.values["messages"][-1].content
-
-            # Handle different response types based on workflow
-            if workflow == "audio":
-                audio_buffer = output_state.values["audio_buffer"]
-                success = await send_response(from_number, response_message, "audio", audio_buffer)
-            elif workflow == "image":
-                image_path = output_state.values["image_path"]
-                with open(image_path, "rb") as f:
-                    image_data = f.read()
-                success = await send_response(from_number, response_message, "image", image_data)
-            else:
-                success = await send_response(from_number, response_message, "text")
-
-            if not success:
-                logger.error("Failed to send WhatsApp message, but acknowledging webhook to prevent retries")
-
-            return Response(content="Message processed", status_code=200)
-
-        elif "statuses" in change_value:
-            return Response(content="Status update received", status_code=200)
-
-        else:
+        messages, statuses = parse_webhook_events(data)
+        if not messages and not statuses:
             return Response(content="Unknown event type", status_code=400)
+        malformed = [message for message in messages if not message.get("id") or not message.get("from")]
+        if malformed:
+            logger.warning(f"Ignoring {len(malformed)} message(s) without an id or sender")
+            messages = [message for message in messages if message not in malformed]
+
+        # Deduplicate: Meta delivers the same webhook from multiple data centers, and may repeat a message
+        # within one batch
+        dedup_store = request.app.state.dedup_store
+        claimed = await dedup_store.claim([message["id"] for message in messages]) if messages else []
+        new_messages = [message for message, is_new in zip(messages, claimed) if is_new]
+        if len(new_messages) < len(messages):
+            logger.debug(f"[dedup] Skipping {len(messages) - len(new_messages)} already-processed message(s)")
+
+        if statuses:
+            logger.debug(f"Received {len(statuses)} status update(s)")
+        if not new_messages:
+            return Response(content="Duplicate message" if messages else "Status update received", status_code=200)
+
+        try:
+            jobs = await request.app.state.job_queue.enqueue_many(
+                [(message["from"], message) for message in new_messages]
+            )
+        except Exception:
+            # Nothing was queued: forget the claims so that Meta's retry is not dropped as a duplicate
+            await dedup_store.release([message["id"] for message in new_messages])
+            raise
+        rejected = [message for message, job in zip(new_messages, jobs) if job is None]
+        if rejected:
+            # Forget the rejected messages so Meta's redelivery is accepted once the backlog has drained; the
+            # ones that were queued are skipped as duplicates then
+            await dedup_store.release([message["id"] for message in rejected])
+            logger.warning(f"Rejecting {len(rejected)} of {len(new_messages)} message(s): job queue is full")
+            return Response(content="Server busy", status_code=503)
+
+        return Response(content=f"Queued {len(new_messages)} message(s)", status_code=200)
 
     except Exception as e:
         logger.error(f"Error processing message: {e}", exc_info=True)
         return Response(content="Internal server error", status_code=500)
 
 
-async def download_media(media_id: str) -> bytes:
-    """Download media from WhatsApp."""
-    media_metadata_url = f"https://graph.facebook.com/v21.0/{media_id}"
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
-
-    async with httpx.AsyncClient() as client:
-        metadata_response = await client.get(media_metadata_url, headers=headers)
-        metadata_response.raise_for_status()
-        metadata = metadata_response.json()
-        download_url = metadata.get("url")
-
-        media_response = await client.get(download_url, headers=headers)
-        media_response.raise_for_status()
-        return media_response.content
-
-
-async def process_audio_message(message: Dict) -> str:
-    """Download and transcribe audio message."""
-    audio_id = message["audio"]["id"]
-    media_metadata_url = f"https://graph.facebook.com/v21.0/{audio_id}"
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
-
-    async with httpx.AsyncClient() as client:
-        metadata_response = await client.get(media_metadata_url, headers=headers)
-        metadata_response.raise_for_status()
-        metadata = metadata_response.json()
-        download_url = metadata.get("url")
-
-    # Download the audio file
-    async with httpx.AsyncClient() as client:
-        audio_response = await client.get(download_url, headers=headers)
-        audio_response.raise_for_status()
-
-    # Prepare for transcription
-    audio_buffer = BytesIO(audio_response.content)
-    audio_buffer.seek(0)
-    audio_data = audio_buffer.read()
-
-    return await speech_to_text.transcribe(audio_data)
-
-
-async def send_response(
-    from_number: str,
-    response_text: str,
-    message_type: str = "text",
-    media_content: bytes = None,
-) -> bool:
-    """Send response to user via WhatsApp API."""
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-        "Content-Type": "application/json",
-    }
-
-    if message_type in ["audio", "image"]:
+async def process_message(graph: CompiledStateGraph, jobs: List[Job]) -> None:
+    """Run a batch of queued WhatsApp messages from one user through the graph agent and send one reply.
+
+    A batch holds more than one message when the job queue coalesces a burst; the messages are added to the thread
+    together and the graph runs once for all of them.
+    """
+    from_number = jobs[0].key
+    session_id = from_number
+
+    # One message that cannot be read (a failed download, say) must not cost the rest of the burst its reply
+    results = await asyncio.gather(*(message_content(job.payload) for job in jobs), return_exceptions=True)
+    contents = []
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Dropping message {job.payload.get('id')} from {from_number}: {result}", exc_info=result)
+        elif result.strip():
+            contents.append(result)
+    if not contents:
+        logger.info(f"Nothing to answer in {len(jobs)} message(s) from {from_number}, skipping graph run")
+        return
+    if len(contents) > 1:
+        logger.info(f"Coalesced {len(contents)} messages from {from_number} into one graph run")
+
+    # Process message through the graph agent
+    summarizer = get_conversation_summarizer()
+    config = {"configurable": {"thread_id": session_id}}
+    async with summarizer.thread_lock(session_id):
+        await graph.ainvoke({"messages": [HumanMessage(content=content) for content in contents]}, config)
+
+        # Get the workflow type and response from the state
+        output_state = await graph.aget_state(config=config)
+
+    workflow = output_state.values.get("workflow", "conversation")
+    response_message = output_state.values["messages"][-1].content
+
+    # Hand the reply to the send queue, which uploads the media from the blob store and retries failures
+    send_queue = get_send_queue()
+    if workflow == "audio":
+        await send_queue.submit(from_number, response_message, "audio", output_state.values["audio_ref"])
+    elif workflow == "image":
+        await send_queue.submit(from_number, response_message, "image", output_state.values["image_ref"])
+    else:
+        await send_queue.submit(from_number, response_message, "text")
+
+    # Fold older messages into the summary in the background; the reply above never waits on it
+    summarizer.schedule(graph, session_id)
+
+
+async def message_content(message: Dict) -> str:
+    """Turn a WhatsApp message into the text the agent sees: transcribed audio, described images or the text.
+
+    Types the agent cannot read (stickers, reactions, locations, ...) give an empty string.
+    """
+    content = ""
+    message_type = message.get("type")
+    if message_type == "audio":
+        content = await process_audio_message(message)
+    elif message_type == "image":
+        # Get image caption if any
+        content = message.get("image", {}).get("caption", "")
+        # Download and analyze image
+        image_bytes = await download_media(message["image"]["id"])
         try:
-            mime_type = "audio/mpeg" if message_type == "audio" else "image/jpeg"
-            media_buffer = BytesIO(media_content)
-            media_id = await upload_media(media_buffer, mime_type)
-            json_data = {
-                "messaging_product": "whatsapp",
-                "to": from_number,
-                "type": message_type,
-                message_type: {"id": media_id},
-            }
-
-            # Add caption for images
-            if message_type == "image":
-                json_data["image"]["caption"] = response_text
+            description = await image_to_text.analyze_image(
+                image_bytes,
+                "Please describe what you see in this image in the context of our conversation.",
+            )
+            content += f"\n[Image Analysis: {description}]"
         except Exception as e:
-            logger.error(f"Media upload failed, falling back to text: {e}")
-            message_type = "text"
+            logger.warning(f"Failed to analyze image: {e}")
+    elif message_type == "text":
+        content = message.get("text", {}).get("body", "")
+    else:
+        logger.info(f"Ignoring unsupported {message_type} message {message.get('id')}")
+    return content
 
-    if message_type == "text":
-        json_data = {
-            "messaging_product": "whatsapp",
-            "to": from_number,
-            "type": "text",
-            "text": {"body": response_text},
-        }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"https://graph.facebook.com/v21.0/{WHATSAPP_PHONE_NUMBER_ID}/messages",
-            headers=headers,
-            json=json_data,
-        )
+async def download_media(media_id: str) -> bytes:
+    """Download media from WhatsApp."""
+    client = get_http_client()
+    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
 
-    if response.status_code != 200:
-        logger.error(f"WhatsApp API error {response.status_code}: {response.text}")
+    metadata_response = await client.get(f"{GRAPH_API_BASE_URL}/{media_id}", headers=headers)
+    metadata_response.raise_for_status()
+    download_url = metadata_response.json().get("url")
 
-    return response.status_code == 200
+    media_response = await client.get(download_url, headers=headers)
+    media_response.raise_for_status()
+    return media_response.content
 
 
-async def upload_media(media_content: BytesIO, mime_type: str) -> str:
-    """Upload media to WhatsApp servers."""
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
-    files = {"file": ("response.mp3", media_content, mime_type)}
-    data = {"messaging_product": "whatsapp", "type": mime_type}
-
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"https://graph.facebook.com/v21.0/{WHATSAPP_PHONE_NUMBER_ID}/media",
-            headers=headers,
-            files=files,
-            data=data,
-        )
-        result = response.json()
-
-    if "id" not in result:
-        raise Exception("Failed to upload media")
-    return result["id"]
\ No newline at end of file
+async def process_audio_message(message: Dict) -> str:
+    """Download and transcribe audio message.
+
+    Voice notes seen before (same media ID, or the same file hash in the webhook) skip both the download and the
+    STT call; otherwise the downloaded bytes are looked up by content hash before calling Whisper.
+    """
+    audio = message["audio"]
+    aliases = [f"media:{audio['id']}"] + ([f"sha256:{audio['sha256']}"] if audio.get("sha256") else [])
+    cache = get_transcription_cache()
+    transcription = await cache.get_by_alias(aliases)
+    if transcription is not None:
+        return transcription
+
+    audio_data = await download_media(audio["id"])
+    content_key = cache.content_key(audio_data)
+    transcription = await cache.get(content_key)
+    if transcription is not None:
+        await cache.link(content_key, aliases)
+        return transcription
+
+    transcription = await speech_to_text.transcribe(audio_data)
+    await cache.put(content_key, transcription, aliases)
+    return transcription